@@ -0,0 +1,235 @@
+"""Формат callback_data кнопок и маршрутизация нажатий.
+
+callback_data имеет вид ``<версия>:<действие>[:<аргумент>...]``, например
+``1:acc:42``. Аргументы типизированы: для каждого действия задан список
+преобразователей, неверное число или формат аргументов - ошибка разбора.
+Telegram ограничивает callback_data 64 байтами, это проверяется при
+создании кнопки.
+
+Кнопки старого формата (``accept_42``) на переходный период разбираются
+в те же действия (CALLBACK_ACCEPT_LEGACY): карточки, отправленные до
+обновления, остаются в группе. Поврежденные данные отклоняются до вызова
+обработчика и обращения к БД.
+
+Данные нажатия разбираются один раз на обновление (``parse``): фильтры
+ActionHandler, CallbackRouter и сами обработчики берут готовый результат.
+"""
+import logging
+import re
+from collections import namedtuple
+
+from telegram import Update
+from telegram.constants import InlineKeyboardButtonLimit
+from telegram.ext import CallbackQueryHandler
+
+from cache import LRUCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+VERSION = '1'
+_SEPARATOR = ':'
+
+
+def _uint(value):
+    """Неотрицательное целое (id заявки) только из ASCII-цифр"""
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError(f"ожидалось число: {value!r}")
+    return int(value)
+
+
+def _choice(*allowed):
+    def convert(value):
+        if value not in allowed:
+            raise ValueError(f"ожидалось одно из {allowed}: {value!r}")
+        return value
+    return convert
+
+
+# Действия
+CREATE = 'new'
+ACCEPT = 'acc'
+RETURN = 'ret'
+CANCEL_RETURN = 'ret_x'
+CLOSE = 'cls'
+CLOSE_FROM_LIST = 'cls_l'
+CLOSE_DONE = 'cls_ok'
+CLOSE_REFUSED = 'cls_no'
+CANCEL_CLOSE = 'cls_x'
+SAVE_CONTACT = 'contact'
+COPY = 'copy'
+MY_ACCEPTED = 'my_acc'
+MY_CREATED = 'my_req'
+ACCEPTED_PAGE = 'acc_pg'
+CREATED_PAGE = 'req_pg'
+HELP = 'help'
+MENU = 'menu'
+
+# Действие -> преобразователи аргументов
+_ARGS = {
+    CREATE: (),
+    ACCEPT: (_uint,),
+    RETURN: (_uint,),
+    CANCEL_RETURN: (_uint,),
+    CLOSE: (_uint,),
+    CLOSE_FROM_LIST: (_uint,),
+    CLOSE_DONE: (_uint,),
+    CLOSE_REFUSED: (_uint,),
+    CANCEL_CLOSE: (_uint,),
+    SAVE_CONTACT: (_uint,),
+    COPY: (_choice('phone', 'address'), _uint),
+    MY_ACCEPTED: (),
+    MY_CREATED: (),
+    # Направление и курсор страницы (см. database.encode_cursor)
+    ACCEPTED_PAGE: (_choice('next', 'prev'), str),
+    CREATED_PAGE: (_choice('next', 'prev'), str),
+    HELP: (),
+    MENU: (),
+}
+
+# Старый формат callback_data (до версии 1) -> действие; группы - аргументы
+_LEGACY = tuple((re.compile(pattern), action) for pattern, action in (
+    (r'accept_([0-9]+)', ACCEPT),
+    (r'return_app_([0-9]+)', RETURN),
+    (r'cancel_return_([0-9]+)', CANCEL_RETURN),
+    (r'close_app_([0-9]+)', CLOSE),
+    (r'close_from_list_([0-9]+)', CLOSE_FROM_LIST),
+    (r'close_done_([0-9]+)', CLOSE_DONE),
+    (r'close_refused_([0-9]+)', CLOSE_REFUSED),
+    (r'cancel_close_([0-9]+)', CANCEL_CLOSE),
+    (r'save_contact_([0-9]+)', SAVE_CONTACT),
+    (r'copy_(phone|address)_([0-9]+)', COPY),
+    (r'create_application', CREATE),
+    (r'my_accepted_apps', MY_ACCEPTED),
+    (r'my_created_apps', MY_CREATED),
+    (r'show_help', HELP),
+    (r'back_to_menu', MENU),
+))
+
+CallbackData = namedtuple('CallbackData', ['action', 'args'])
+
+# Результат разбора по id нажатия: одно обновление проверяют несколько фильтров
+_parsed = LRUCache(maxsize=1000, ttl=60)
+
+
+class InvalidCallbackData(ValueError):
+    """callback_data старого формата, неизвестного действия или с неверными аргументами"""
+
+
+def encode(action, *args):
+    """callback_data для кнопки; ValueError, если данные не подходят под формат"""
+    converters = _ARGS.get(action)
+    if converters is None:
+        raise ValueError(f"Неизвестное действие кнопки: {action!r}")
+    if len(args) != len(converters):
+        raise ValueError(f"Действие {action!r} ожидает аргументов: {len(converters)}")
+    parts = [VERSION, action]
+    for arg in args:
+        arg = str(arg)
+        if _SEPARATOR in arg:
+            raise ValueError(f"Аргумент кнопки содержит '{_SEPARATOR}': {arg!r}")
+        parts.append(arg)
+    data = _SEPARATOR.join(parts)
+    if len(data.encode()) > InlineKeyboardButtonLimit.MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее 64 байт: {data!r}")
+    return data
+
+
+def decode(data):
+    """Разбирает callback_data в CallbackData; InvalidCallbackData при ошибке"""
+    if not isinstance(data, str):
+        raise InvalidCallbackData("callback_data отсутствует")
+    version, _, rest = data.partition(_SEPARATOR)
+    if version == VERSION:
+        action, *raw_args = rest.split(_SEPARATOR)
+    else:
+        action, raw_args = _decode_legacy(data)
+    converters = _ARGS.get(action)
+    if converters is None or len(raw_args) != len(converters):
+        raise InvalidCallbackData(f"Неизвестное действие или число аргументов: {data!r}")
+    try:
+        args = tuple(convert(arg) for convert, arg in zip(converters, raw_args))
+    except ValueError as e:
+        raise InvalidCallbackData(f"Неверный аргумент в {data!r}: {e}") from None
+    return CallbackData(action, args)
+
+
+def _decode_legacy(data):
+    """(действие, аргументы) для callback_data старого формата"""
+    if Config.CALLBACK_ACCEPT_LEGACY:
+        for pattern, action in _LEGACY:
+            match = pattern.fullmatch(data)
+            if match:
+                return action, list(match.groups())
+    raise InvalidCallbackData(f"Неподдерживаемый формат callback_data: {data!r}")
+
+
+def parse(query):
+    """CallbackData нажатия query; InvalidCallbackData при ошибке.
+
+    Разбирает данные один раз, повторные вызовы для того же нажатия
+    берут результат из кэша.
+    """
+    result = _parsed.get(query.id)
+    if result is None:
+        try:
+            result = decode(query.data)
+        except InvalidCallbackData as e:
+            result = e
+        _parsed.set(query.id, result)
+    if isinstance(result, InvalidCallbackData):
+        raise result
+    return result
+
+
+class ActionHandler(CallbackQueryHandler):
+    """CallbackQueryHandler для нажатий одного действия.
+
+    Пропускает только корректно разобранные данные, остальные достаются
+    CallbackRouter и отклоняются им.
+    """
+
+    def __init__(self, action, callback, **kwargs):
+        if action not in _ARGS:
+            raise ValueError(f"Неизвестное действие кнопки: {action!r}")
+        super().__init__(callback, **kwargs)
+        self.action = action
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or update.callback_query is None:
+            return False
+        try:
+            return parse(update.callback_query).action == self.action
+        except InvalidCallbackData:
+            return False
+
+
+class CallbackRouter:
+    """Один обработчик всех нажатий: действие -> функция через словарь.
+
+    Регистрируется последним CallbackQueryHandler без pattern. Нажатия
+    с неверными данными или без обработчика получают одинаковый ответ.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+
+    def add(self, action, callback):
+        if action not in _ARGS:
+            raise ValueError(f"Неизвестное действие кнопки: {action!r}")
+        self.routes[action] = callback
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        try:
+            callback = self.routes.get(parse(query).action)
+        except InvalidCallbackData as e:
+            logger.info(f"Отклонено нажатие пользователя {query.from_user.id}: {e}")
+            callback = None
+        if callback is None:
+            await query.answer(
+                "⚠️ Эта кнопка устарела. Откройте меню заново командой /start",
+                show_alert=True
+            )
+            return None
+        return await callback(update, context)
@@ -0,0 +1,176 @@
+"""Текст карточки заявки в группе исполнителей.
+
+Шаблоны для каждого вида карточки разбираются один раз при импорте.
+Значения полей экранируются для Markdown (parse_mode=MARKDOWN), а текст
+укладывается в лимит Telegram (4096 для сообщения, 1024 для подписи к фото)
+за счет сокращения самых длинных полей, а не обрезки посередине разметки.
+
+Готовый текст кэшируется по (id заявки, версия строки): версия растет при
+каждом изменении заявки (см. Database), поэтому повторная отрисовка той же
+карточки при правках и повторах отправки ничего не стоит.
+"""
+from string import Formatter
+
+from telegram.constants import MessageLimit
+from telegram.helpers import escape_markdown
+
+from cache import LRUCache
+from config import Config
+
+# Виды карточек заявки
+CARD_NEW = 'new'            # создана в боте
+CARD_SITE = 'site'          # пришла с сайта
+CARD_RETURNED = 'returned'  # возвращена исполнителем
+CARD_ACCEPTED = 'accepted'  # принята исполнителем
+CARD_CLOSED = 'closed'      # закрыта
+
+# Строки шаблонов: (формат, поле) - строка выводится, только если поле не пустое.
+# Поле None - строка выводится всегда. Значения подставляются уже экранированными.
+_TEMPLATES = {
+    CARD_NEW: (
+        ("Новая заявка #{id}\n\n", None),
+        ("Адрес: {address}\n", None),
+        ("Задача: {task}\n", None),
+        ("Комментарий: {comment}\n", 'comment'),
+        ("От: @{username}", None),
+    ),
+    CARD_SITE: (
+        ("Новая заявка #{id} \nВнимание!\nЗаявка напрямую от клиента. Не забудьте сделать скидку 10%\n\n", None),
+        ("Адрес: {address}\n", None),
+        ("Задача: {task}\n", None),
+        ("Комментарий: {comment}\n", 'comment'),
+        ("📸 Фото приложено\n", 'photo_attached'),
+        ("От: {username}", None),
+    ),
+    CARD_RETURNED: (
+        ("🔄 Заявка #{id} ВОЗВРАЩЕНА\n\n", None),
+        ("Адрес: {address}\n", None),
+        ("Задача: {task}\n", None),
+        ("Комментарий: {comment}\n", 'comment'),
+        ("От: @{username}\n", None),
+        ("Причина возврата: {return_reason}\n", None),
+        ("Вернул: @{returned_username}", None),
+    ),
+    CARD_ACCEPTED: (
+        ("Заявка #{id} ПРИНЯТА\n\n", None),
+        ("Адрес: {address}\n", None),
+        ("Задача: {task}\n", None),
+        ("Комментарий: {comment}\n", 'comment'),
+        ("От: @{username}\n", None),
+        ("Принял: @{accepted_username}", None),
+    ),
+    CARD_CLOSED: (
+        ("🔒 Заявка #{id} ЗАКРЫТА\n\n", None),
+        ("Адрес: {address}\n", None),
+        ("Задача: {task}\n", None),
+        ("Исполнитель: @{accepted_username}\n", None),
+        ("Причина: {close_reason}", None),
+    ),
+}
+
+# Поля, которые можно сокращать при превышении лимита, в порядке сокращения
+_TRUNCATABLE = ('comment', 'task', 'return_reason', 'close_reason', 'address')
+_ELLIPSIS = '…'
+
+
+def _compile(lines):
+    """Разбирает строки шаблона: (литералы и поля, условие)"""
+    compiled = []
+    for fmt, condition in lines:
+        parts = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(fmt)
+        )
+        compiled.append((parts, condition))
+    return tuple(compiled)
+
+
+_COMPILED = {card: _compile(lines) for card, lines in _TEMPLATES.items()}
+_FIELDS = {
+    card: frozenset(field for parts, _ in compiled for _, field in parts if field)
+    for card, compiled in _COMPILED.items()
+}
+
+# Карточка для (id, версия) не меняется, TTL лишь ограничивает память
+_cache = LRUCache(maxsize=Config.APP_CACHE_SIZE, ttl=3600)
+
+
+def _telegram_length(text):
+    # Telegram считает длину в единицах UTF-16
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _truncate(text, limit):
+    """Обрезает text до limit единиц UTF-16 вместе с многоточием.
+
+    Разрез не попадает внутрь суррогатной пары и не оставляет в конце
+    обратный слэш, который экранировал бы многоточие вместо символа.
+    """
+    encoded = text.encode('utf-16-le')[:(limit - _telegram_length(_ELLIPSIS)) * 2]
+    if len(encoded) >= 2 and 0xD800 <= int.from_bytes(encoded[-2:], 'little') <= 0xDBFF:
+        encoded = encoded[:-2]
+    return encoded.decode('utf-16-le').rstrip('\\') + _ELLIPSIS
+
+
+def _escape(value):
+    return escape_markdown(str(value), version=1) if value is not None else ''
+
+
+def _render(compiled, values, raw):
+    out = []
+    for parts, condition in compiled:
+        if condition is not None and not raw.get(condition):
+            continue
+        for literal, field in parts:
+            out.append(literal)
+            if field:
+                out.append(values[field])
+    return ''.join(out)
+
+
+def _fit(compiled, raw, limit):
+    """Текст в пределах limit: сокращает длинные поля до экранирования"""
+    values = {field: _escape(value) for field, value in raw.items()}
+    text = _render(compiled, values, raw)
+    for field in _TRUNCATABLE:
+        overflow = _telegram_length(text) - limit
+        if overflow <= 0:
+            return text
+        value = raw.get(field)
+        if not value:
+            continue
+        value = str(value)
+        # Экранирование не уменьшает длину, поэтому сокращения исходного
+        # значения на overflow символов (+ многоточие) достаточно
+        raw[field] = value[:max(0, len(value) - overflow - len(_ELLIPSIS))] + _ELLIPSIS
+        values[field] = _escape(raw[field])
+        text = _render(compiled, values, raw)
+    if _telegram_length(text) > limit:
+        # Остались только короткие поля - до этого не доходит при разумных данных
+        text = _truncate(text, limit)
+    return text
+
+
+def render_card(application, card, caption=False, photo_attached=False):
+    """Текст карточки заявки (Markdown) для группы исполнителей.
+
+    ``caption`` - карточка будет подписью к фото (лимит 1024 вместо 4096).
+    """
+    compiled = _COMPILED[card]
+    version = application.get('version')
+    key = (application['id'], version, card, caption, photo_attached)
+    if version is not None:
+        text = _cache.get(key)
+        if text is not None:
+            return text
+
+    raw = {field: application.get(field) for field in _FIELDS[card]}
+    # Пустой или пробельный комментарий не выводится
+    if raw.get('comment') is not None and not str(raw['comment']).strip():
+        raw['comment'] = None
+    raw['photo_attached'] = photo_attached
+    limit = MessageLimit.CAPTION_LENGTH if caption else MessageLimit.MAX_TEXT_LENGTH
+    text = _fit(compiled, raw, limit)
+
+    if version is not None:
+        _cache.set(key, text)
+    return text
@@ -0,0 +1,161 @@
+"""Обработка обновлений, накопившихся у Telegram, пока бот был остановлен.
+
+Вместо drop_pending_updates бот при старте забирает очередь getUpdates и
+обрабатывает ее сам: обновления разных пользователей - параллельно (не
+больше CATCHUP_CONCURRENCY одновременно), одного - по порядку. Получение
+пачки подтверждается только после ее обработки, поэтому падение во время
+догона не теряет обновления. Нажатия кнопок, про которые нельзя показать,
+что они моложе CATCHUP_MAX_AGE, отбрасываются, чтобы исполнитель не
+"принял" заявку, о которой давно забыл. Нижняя граница давности - отметка
+работы бота в bot_state; без нее (первый запуск) нажатия не отбрасываются.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from telegram import Update
+
+from config import Config
+from database import db
+from update_processor import update_key
+
+logger = logging.getLogger(__name__)
+
+# Бот периодически отмечает, что работает: нажатия, накопившиеся после
+# последней отметки, не старше простоя бота. Отметка хранится в bot_state
+# напрямую, а не через state_store: с STATE_BACKEND=memory она терялась бы
+# при каждом перезапуске
+_HEARTBEAT_INTERVAL = 30  # секунд
+_HEARTBEAT_TTL = 30 * 24 * 3600
+_HEARTBEAT_KEY = ('catchup', 'alive')
+
+# Сколько обновлений getUpdates отдает за раз
+_PAGE_SIZE = 100
+
+
+async def last_alive():
+    """Время (unix) последней отметки работы бота или None"""
+    value = await db.get_state_value(*_HEARTBEAT_KEY)
+    return value['at'] if value else None
+
+
+async def run_heartbeat():
+    """Фоновая задача: отмечает работу бота раз в _HEARTBEAT_INTERVAL секунд"""
+    while True:
+        try:
+            await db.set_state_value(*_HEARTBEAT_KEY, {'at': time.time()}, _HEARTBEAT_TTL)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить отметку работы бота: {e}")
+        await asyncio.sleep(_HEARTBEAT_INTERVAL)
+
+
+def _update_date(update):
+    """Время обновления (unix), если Telegram его сообщает"""
+    message = update.edited_message or update.edited_channel_post
+    if message and message.edit_date:
+        return message.edit_date.timestamp()
+    message = update.message or update.channel_post
+    if message:
+        return message.date.timestamp()
+    if update.my_chat_member or update.chat_member:
+        return (update.my_chat_member or update.chat_member).date.timestamp()
+    return None
+
+
+def _stale_callback_ids(updates, max_age, now, not_before=None):
+    """update_id нажатий кнопок, про которые нельзя показать, что они свежие.
+
+    У callback_query нет времени нажатия. Нажатие было не раньше последней
+    отметки работы бота, предыдущего датированного обновления и сообщения
+    с кнопкой; если и эта нижняя граница старше max_age, возраст нажатия
+    неизвестен и оно отбрасывается.
+
+    Возвращает (stale, not_before) - граница для следующей пачки.
+    """
+    stale = set()
+    for update in updates:
+        date = _update_date(update)
+        if date is not None:
+            not_before = max(not_before or 0, date)
+        elif update.callback_query:
+            bound = not_before or 0
+            message = update.callback_query.message
+            if message and message.date:
+                bound = max(bound, message.date.timestamp())
+            if now - bound > max_age:
+                stale.add(update.update_id)
+    return stale, not_before
+
+
+def _sequence_key(update):
+    """Ключ, обновления с которым обрабатываются строго по порядку"""
+    return update_key(update) or ('update', update.update_id)
+
+
+async def _process(application, updates, semaphore):
+    chains = defaultdict(list)
+    for update in updates:
+        chains[_sequence_key(update)].append(update)
+
+    async def process_chain(chain):
+        for update in chain:
+            async with semaphore:
+                # Ошибки обработчиков уходят в error_handler приложения
+                await application.process_update(update)
+
+    await asyncio.gather(*(process_chain(chain) for chain in chains.values()))
+
+
+async def catch_up(application, max_age=None, concurrency=None, limit=None):
+    """Обрабатывает очередь обновлений перед запуском polling.
+
+    Возвращает (обработано, отброшено).
+    """
+    max_age = Config.CATCHUP_MAX_AGE if max_age is None else max_age
+    concurrency = concurrency or Config.CATCHUP_CONCURRENCY
+    limit = limit or Config.CATCHUP_MAX_UPDATES
+    bot = application.bot
+
+    # getUpdates не работает, пока установлен вебхук
+    await bot.delete_webhook(drop_pending_updates=False)
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        not_before = await last_alive()
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать отметку работы бота: {e}")
+        not_before = None
+    # Без отметки (первый запуск) давность нажатий оценить не по чему:
+    # отбрасывать все нажатия на старых карточках хуже, чем обработать их
+    check_age = not_before is not None
+    if not check_age:
+        logger.warning("Нет отметки работы бота, нажатия кнопок обрабатываются без проверки давности")
+    offset = None
+    replayed = dropped = 0
+    while replayed + dropped < limit:
+        # Запрос со смещением подтверждает предыдущую, уже обработанную пачку
+        batch = await bot.get_updates(
+            offset=offset, limit=min(_PAGE_SIZE, limit - replayed - dropped), timeout=0,
+            allowed_updates=Update.ALL_TYPES
+        )
+        if not batch:
+            break
+        stale = set()
+        if check_age:
+            stale, not_before = _stale_callback_ids(batch, max_age, time.time(), not_before)
+        await _process(application, [u for u in batch if u.update_id not in stale], semaphore)
+        replayed += len(batch) - len(stale)
+        dropped += len(stale)
+        offset = batch[-1].update_id + 1
+    if offset is None:
+        return 0, 0
+
+    # Подтверждаем последнюю пачку, polling начнет со следующих обновлений
+    await bot.get_updates(offset=offset, limit=1, timeout=0)
+    logger.info(
+        f"Обработаны накопившиеся обновления: {replayed}, "
+        f"отброшено нажатий неизвестной давности: {dropped}"
+    )
+    if replayed + dropped >= limit:
+        logger.warning(f"Очередь обновлений больше {limit}, остальные придут через polling")
+    return replayed, dropped
@@ -12,9 +12,102 @@ class Config:
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL must be set in .env file")
     
+    # Пул соединений с БД
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # секунд ожидания свободного соединения
+    # Отдельный пул HTTP-сервера приема заявок с сайта
+    API_DB_POOL_MIN_SIZE = int(os.getenv('API_DB_POOL_MIN_SIZE', 1))
+    API_DB_POOL_MAX_SIZE = int(os.getenv('API_DB_POOL_MAX_SIZE', 5))
+    
+    # Кэш строк заявок в памяти процесса
+    APP_CACHE_SIZE = int(os.getenv('APP_CACHE_SIZE', 1000))
+    APP_CACHE_TTL = float(os.getenv('APP_CACHE_TTL', 300))  # секунд
+    
+    # Состояния диалогов (создание/возврат/закрытие заявки): memory или postgres
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'postgres')
+    STATE_TTL = float(os.getenv('STATE_TTL', 24 * 3600))  # секунд; брошенный диалог забывается
+    STATE_MAX_ENTRIES = int(os.getenv('STATE_MAX_ENTRIES', 10000))
+    STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 2))  # секунд между записями в БД
+    # Через сколько секунд бездействия диалог (создание/возврат/закрытие) завершается
+    CONVERSATION_TIMEOUT = float(os.getenv('CONVERSATION_TIMEOUT', 3600))
+    
+    # Количество заявок на одной странице списков "Взятые"/"Отправленные"
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', 5))
+    
     ADMIN_GROUP_CHAT_ID = int(os.getenv('ADMIN_GROUP_CHAT_ID', -1001234567890))
+    
+    # Чат для загрузки фото с сайта (по умолчанию - группа исполнителей,
+    # фото в пакетных запросах без него не принимаются)
+    PHOTO_STORAGE_CHAT_ID = int(os.getenv('PHOTO_STORAGE_CHAT_ID', 0)) or None
+    # Ограничения multipart-загрузки фото с сайта
+    PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 10 * 1024 * 1024))  # лимит Telegram для фото
+    PHOTO_MAX_PARTS = int(os.getenv('PHOTO_MAX_PARTS', 5))
+    # Удалять вспомогательное сообщение с фото после получения file_id
+    PHOTO_DELETE_HELPER_MESSAGE = os.getenv('PHOTO_DELETE_HELPER_MESSAGE', 'false').lower() in ('1', 'true', 'yes')
 
     API_KEY = os.getenv('BOT_API_KEY', 'your-secret-api-key-here')  #
     
+    # Секрет подписи токенов в ссылках "Получить данные заявки"
+    # (по умолчанию выводится из BOT_TOKEN; должен совпадать у всех реплик)
+    TOKEN_SECRET = os.getenv('TOKEN_SECRET')
+    # Принимать кнопки старого формата (accept_42) с карточек, отправленных
+    # до перехода на версионный callback_data. Выключить, когда их не останется
+    CALLBACK_ACCEPT_LEGACY = os.getenv('CALLBACK_ACCEPT_LEGACY', 'true').lower() in ('1', 'true', 'yes')
+    
+    # HTTP-сервер приема заявок с сайта
+    API_HOST = os.getenv('API_HOST', '0.0.0.0')
+    API_PORT = int(os.getenv('API_PORT', 7000))
+    API_WORKERS = int(os.getenv('API_WORKERS', 1))  # процессов uvicorn в режиме api
+    # Получение обновлений от Telegram: polling или webhook.
+    # webhook работает только в режиме all: Telegram присылает обновления
+    # на TELEGRAM_WEBHOOK_URL, который должен вести на TELEGRAM_WEBHOOK_PATH этого сервера
+    UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling')
+    TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+    TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook')
+    TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')  # 1-256 символов A-Z, a-z, 0-9, _ и -
+    
+    # Сколько обновлений (разных пользователей) обрабатывается одновременно
+    UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 16))
+    
+    # Обработка обновлений, накопившихся за время остановки бота (polling).
+    # Если выключено, они отбрасываются при старте
+    CATCHUP_ENABLED = os.getenv('CATCHUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    CATCHUP_MAX_AGE = float(os.getenv('CATCHUP_MAX_AGE', 300))  # секунд; старые нажатия кнопок отбрасываются
+    CATCHUP_CONCURRENCY = int(os.getenv('CATCHUP_CONCURRENCY', 8))
+    CATCHUP_MAX_UPDATES = int(os.getenv('CATCHUP_MAX_UPDATES', 1000))
+    
+    # Отправлять карточки из outbox и из процессов API. По умолчанию их отправляет
+    # только бот: у каждого процесса свой ограничитель запросов (см. ratelimit)
+    API_OUTBOX_RELAY = os.getenv('API_OUTBOX_RELAY', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Сколько секунд помнить ключи идемпотентности в памяти (в БД - бессрочно)
+    IDEMPOTENCY_CACHE_TTL = float(os.getenv('IDEMPOTENCY_CACHE_TTL', 600))
+    
+    # Лимиты Bot API, общие для бота и HTTP-сервера
+    RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', 30))
+    RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', 20))
+    RATE_LIMIT_PRIVATE_PER_SECOND = float(os.getenv('RATE_LIMIT_PRIVATE_PER_SECOND', 1))
+    RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 2))  # повторов после RetryAfter
+    
+    # Диспетчер исходящих сообщений
+    DISPATCHER_WORKERS = int(os.getenv('DISPATCHER_WORKERS', 4))
+    DISPATCHER_QUEUE_SIZE = int(os.getenv('DISPATCHER_QUEUE_SIZE', 1000))
+    # Outbox: карточки заявок отправляются фоновым relay с повторами
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))  # секунд между опросами таблицы
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', 300))  # секунд на отправку взятой записи
+    OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 5))  # первая задержка повтора, дальше x2
+    OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 600))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 20))
+    # Максимум заявок и размер тела одного пакетного запроса
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+    BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', 32 * 1024 * 1024))
+    # Одновременных загрузок фото пакета. Фото пакета принимаются только при
+    # заданном PHOTO_STORAGE_CHAT_ID: группа исполнителей - не больше 20 сообщений в минуту
+    BATCH_PHOTO_CONCURRENCY = int(os.getenv('BATCH_PHOTO_CONCURRENCY', 4))
+    
     # States для ConversationHandler
-    ADDRESS, PHONE, TASK, COMMENT, PHOTO = range(5)  # Добавили PHOTO
\ No newline at end of file
+    ADDRESS, PHONE, TASK, COMMENT, PHOTO = range(5)  # Добавили PHOTO
+    # Возврат (ожидание причины текстом) и закрытие (выбор причины кнопкой)
+    RETURN_REASON, CLOSE_REASON = range(5, 7)
\ No newline at end of file
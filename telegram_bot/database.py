@@ -1,139 +1,78 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import logging
+import orjson
+from datetime import datetime, timedelta
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
 from config import Config
+from cache import LRUCache
+import migrate
+import outbox
+
+logger = logging.getLogger(__name__)
+
+# Кэш строк заявок по id. Общий для всех экземпляров Database в процессе,
+# чтобы запись через любой из них инвалидировала закэшированную строку.
+application_cache = LRUCache(maxsize=Config.APP_CACHE_SIZE, ttl=Config.APP_CACHE_TTL)
+
+# Вид записи outbox: карточка заявки в группе исполнителей
+OUTBOX_GROUP_CARD = 'group_card'
 
 class Database:
-    def __init__(self):
-        self.conn = psycopg2.connect(Config.DATABASE_URL)
-        self.create_tables()
-        self.update_tables()
-    
-    def create_tables(self):
-        with self.conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS applications (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    username VARCHAR(100),
-                    address TEXT NOT NULL,
-                    phone VARCHAR(20) NOT NULL,
-                    task TEXT NOT NULL,
-                    comment TEXT,
-                    photo_file_id VARCHAR(200),  -- Добавлено поле для фото
-                    status VARCHAR(20) DEFAULT 'pending',
-                    accepted_by BIGINT,
-                    accepted_username VARCHAR(100),
-                    return_reason TEXT,
-                    returned_by BIGINT,
-                    returned_username VARCHAR(100),
-                    close_reason TEXT,
-                    closed_by BIGINT,
-                    closed_username VARCHAR(100),
-                    closed_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    message_id INTEGER
-                )
-            """)
-            self.conn.commit()
-    
-    def update_tables(self):
-        """Обновление структуры существующих таблиц"""
-        with self.conn.cursor() as cursor:
-            try:
-                # Проверяем существование новых колонок и добавляем их при необходимости
-                cursor.execute("""
-                    DO $$
-                    BEGIN
-                        -- Проверяем существование колонки photo_file_id
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='photo_file_id'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN photo_file_id VARCHAR(200);
-                        END IF;
-                        
-                        -- Проверяем существование колонки return_reason
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='return_reason'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN return_reason TEXT;
-                        END IF;
-                        
-                        -- Проверяем существование колонки returned_by
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='returned_by'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN returned_by BIGINT;
-                        END IF;
-                        
-                        -- Проверяем существование колонки returned_username
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='returned_username'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN returned_username VARCHAR(100);
-                        END IF;
-                        
-                        -- Проверяем существование колонки close_reason
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='close_reason'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN close_reason TEXT;
-                        END IF;
-                        
-                        -- Проверяем существование колонки closed_by
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='closed_by'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN closed_by BIGINT;
-                        END IF;
-                        
-                        -- Проверяем существование колонки closed_username
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='closed_username'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN closed_username VARCHAR(100);
-                        END IF;
-                        
-                        -- Проверяем существование колонки closed_at
-                        IF NOT EXISTS (
-                            SELECT 1 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' 
-                            AND column_name='closed_at'
-                        ) THEN
-                            ALTER TABLE applications ADD COLUMN closed_at TIMESTAMP;
-                        END IF;
-                    END $$;
-                """)
-                self.conn.commit()
-                print("Таблица 'applications' успешно обновлена")
-            except Exception as e:
-                print(f"Ошибка при обновлении таблицы: {e}")
-                self.conn.rollback()
+    """Асинхронный слой доступа к БД поверх пула соединений.
+
+    Пул привязан к event loop, в котором вызван :meth:`connect`, поэтому
+    у бота и HTTP-сервера, работающих в разных loop, свои экземпляры.
+    """
+
+    def __init__(self, min_size=None, max_size=None, timeout=None):
+        self.min_size = min_size or Config.DB_POOL_MIN_SIZE
+        self.max_size = max_size or Config.DB_POOL_MAX_SIZE
+        self.timeout = timeout or Config.DB_POOL_TIMEOUT
+        self.pool = None
+        self.cache = application_cache
+
+    async def connect(self, run_migrations=True):
+        """Открывает пул соединений и при необходимости применяет миграции"""
+        if self.pool is not None:
+            return
+        self.pool = AsyncConnectionPool(
+            Config.DATABASE_URL,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.timeout,
+            kwargs={'row_factory': dict_row},
+            # Проверяем соединение при выдаче из пула, чтобы не получить
+            # "мертвое" соединение после рестарта PostgreSQL
+            check=AsyncConnectionPool.check_connection,
+            open=False
+        )
+        await self.pool.open(wait=True, timeout=self.timeout)
+        logger.info(f"Пул соединений с БД открыт (min={self.min_size}, max={self.max_size})")
+        if run_migrations:
+            await migrate.migrate(self.pool)
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @property
+    def is_connected(self):
+        return self.pool is not None
+
+    async def _enqueue_card(self, conn, app_id, card, **payload):
+        """Добавляет карточку заявки в outbox в транзакции соединения conn"""
+        await conn.execute(
+            "INSERT INTO outbox (kind, application_id, payload) VALUES (%s, %s, %s)",
+            (OUTBOX_GROUP_CARD, app_id, Jsonb({'card': card, **payload}))
+        )
     
-    def create_application(self, application):
-        with self.conn.cursor() as cursor:
-            cursor.execute("""
+    async def create_application(self, application, card='new'):
+        """Создает заявку и в той же транзакции ставит ее карточку в outbox"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
                 INSERT INTO applications 
                 (user_id, username, address, phone, task, comment, photo_file_id, status)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
@@ -143,21 +82,141 @@ class Database:
                   application.task, application.comment,
                   application.photo_file_id,  # Добавлено поле для фото
                   application.status))
-            app_id = cursor.fetchone()[0]
-            self.conn.commit()
-            return app_id
+            row = await cursor.fetchone()
+            await self._enqueue_card(conn, row['id'], card)
+        outbox.notify()  # отправляем, не дожидаясь опроса
+        return row['id']
+    
+    async def create_application_idempotent(self, application, idempotency_key, card='site',
+                                            extra_photo_file_ids=()):
+        """Создает заявку, если заявки с таким ключом идемпотентности еще нет.
+
+        Карточка новой заявки ставится в outbox в той же транзакции.
+        Возвращает (id, created): при повторе - id существующей заявки и False.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                INSERT INTO applications 
+                (user_id, username, address, phone, task, comment, photo_file_id, status, idempotency_key)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                RETURNING id
+            """, (application.user_id, application.username, 
+                  application.address, application.phone, 
+                  application.task, application.comment,
+                  application.photo_file_id,
+                  application.status, idempotency_key))
+            row = await cursor.fetchone()
+            if row:
+                await self._enqueue_card(
+                    conn, row['id'], card, extra_photo_file_ids=list(extra_photo_file_ids)
+                )
+        if row:
+            outbox.notify()  # отправляем, не дожидаясь опроса
+            return row['id'], True
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT id FROM applications WHERE idempotency_key = %s", (idempotency_key,)
+            )
+            row = await cursor.fetchone()
+            return row['id'], False
+    
+    async def create_applications_idempotent(self, items, card='site'):
+        """Пакетное создание заявок одним INSERT в одной транзакции.
+
+        items - список пар (application, idempotency_key). Карточки новых
+        заявок ставятся в outbox в той же транзакции. Возвращает словарь
+        ключ -> (id, created); для уже существующих ключей created = False.
+        """
+        if not items:
+            return {}
+        columns = list(zip(*[
+            (a.user_id, a.username, a.address, a.phone, a.task,
+             a.comment, a.photo_file_id, a.status, key)
+            for a, key in items
+        ]))
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                INSERT INTO applications 
+                (user_id, username, address, phone, task, comment, photo_file_id, status, idempotency_key)
+                SELECT * FROM unnest(
+                    %s::bigint[], %s::varchar[], %s::text[], %s::varchar[], %s::text[],
+                    %s::text[], %s::varchar[], %s::varchar[], %s::char(64)[]
+                )
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                RETURNING id, idempotency_key
+            """, [list(column) for column in columns])
+            result = {row['idempotency_key']: (row['id'], True) for row in await cursor.fetchall()}
+            if result:
+                await conn.execute("""
+                    INSERT INTO outbox (kind, application_id, payload)
+                    SELECT %s, app_id, %s FROM unnest(%s::int[]) AS app_id
+                """, (OUTBOX_GROUP_CARD, Jsonb({'card': card}), [app_id for app_id, _ in result.values()]))
+            
+            missing = [key for _, key in items if key not in result]
+            if missing:
+                cursor = await conn.execute(
+                    "SELECT id, idempotency_key FROM applications WHERE idempotency_key = ANY(%s)",
+                    (missing,)
+                )
+                for row in await cursor.fetchall():
+                    result[row['idempotency_key']] = (row['id'], False)
+        if any(created for _, created in result.values()):
+            outbox.notify()  # отправляем, не дожидаясь опроса
+        return result
+    
+    async def get_application_ids_by_idempotency_keys(self, keys):
+        """Словарь ключ идемпотентности -> id для уже созданных заявок"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT id, idempotency_key FROM applications WHERE idempotency_key = ANY(%s)",
+                (list(keys),)
+            )
+            return {row['idempotency_key']: row['id'] for row in await cursor.fetchall()}
     
-    # Остальные методы остаются без изменений...
-    def get_application(self, app_id):
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("SELECT * FROM applications WHERE id = %s", (app_id,))
-            return cursor.fetchone()
+    async def get_application_id_by_idempotency_key(self, idempotency_key):
+        """id заявки, созданной с указанным ключом идемпотентности"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT id FROM applications WHERE idempotency_key = %s", (idempotency_key,)
+            )
+            row = await cursor.fetchone()
+            return row['id'] if row else None
     
-    def accept_application(self, app_id, user_id, username):
-        with self.conn.cursor() as cursor:
-            cursor.execute("""
+    def _cache_row(self, app_id, row):
+        """Кладет строку в кэш (или инвалидирует, если строки нет) и возвращает копию"""
+        if row is None:
+            self.cache.invalidate(app_id)
+            return None
+        self.cache.set(app_id, row)
+        return dict(row)
+    
+    async def get_application(self, app_id, cached=True):
+        """Строка заявки; cached=False - всегда из БД (кэш обновляется)"""
+        row = self.cache.get(app_id) if cached else None
+        if row is not None:
+            return dict(row)
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("SELECT * FROM applications WHERE id = %s", (app_id,))
+            row = await cursor.fetchone()
+        if row is not None:
+            self.cache.set(app_id, row)
+            return dict(row)
+        return None
+    
+    async def accept_application(self, app_id, user_id, username):
+        """Принимает ожидающую заявку.
+
+        Проверка статуса и обновление выполняются одним запросом, поэтому при
+        одновременном нажатии "Принять" заявку получит только один исполнитель.
+        Возвращает обновленную строку или None, если заявка не найдена или уже
+        не ожидает исполнителя.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
                 UPDATE applications 
                 SET status = 'accepted', 
+                    version = version + 1,
                     accepted_by = %s, 
                     accepted_username = %s,
                     return_reason = NULL,
@@ -167,18 +226,24 @@ class Database:
                     closed_by = NULL,
                     closed_username = NULL,
                     closed_at = NULL
-                WHERE id = %s
-                RETURNING id
+                WHERE id = %s AND status = 'pending'
+                RETURNING *
             """, (user_id, username, app_id))
-            result = cursor.fetchone()
-            self.conn.commit()
-            return result is not None
+            row = await cursor.fetchone()
+        return self._cache_row(app_id, row)
     
-    def return_application(self, app_id, user_id, username, reason):
-        with self.conn.cursor() as cursor:
-            cursor.execute("""
+    async def return_application(self, app_id, user_id, username, reason):
+        """Возвращает заявку в общий чат.
+
+        Вернуть можно только принятую заявку и только тому, кто ее принял.
+        Новая карточка для группы ставится в outbox в той же транзакции.
+        Возвращает обновленную строку или None, если условие не выполнено.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
                 UPDATE applications 
                 SET status = 'pending', 
+                    version = version + 1,
                     return_reason = %s,
                     returned_by = %s,
                     returned_username = %s,
@@ -186,74 +251,291 @@ class Database:
                     closed_by = NULL,
                     closed_username = NULL,
                     closed_at = NULL
-                WHERE id = %s
-                RETURNING id
-            """, (reason, user_id, username, app_id))
-            result = cursor.fetchone()
-            self.conn.commit()
-            return result is not None
+                WHERE id = %s AND accepted_by = %s AND status = 'accepted'
+                RETURNING *
+            """, (reason, user_id, username, app_id, user_id))
+            row = await cursor.fetchone()
+            if row:
+                await self._enqueue_card(conn, app_id, 'returned')
+        if row:
+            outbox.notify()  # отправляем, не дожидаясь опроса
+        return self._cache_row(app_id, row)
     
-    def close_application(self, app_id, user_id, username, reason):
-        """Закрытие заявки"""
-        with self.conn.cursor() as cursor:
-            from datetime import datetime
-            cursor.execute("""
+    async def close_application(self, app_id, user_id, username, reason):
+        """Закрытие заявки.
+
+        Закрыть можно только принятую заявку и только тому, кто ее принял.
+        Возвращает обновленную строку или None, если условие не выполнено.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
                 UPDATE applications 
                 SET status = 'closed', 
+                    version = version + 1,
                     close_reason = %s,
                     closed_by = %s,
                     closed_username = %s,
                     closed_at = %s
-                WHERE id = %s
-                RETURNING id
-            """, (reason, user_id, username, datetime.now(), app_id))
-            result = cursor.fetchone()
-            self.conn.commit()
-            return result is not None
+                WHERE id = %s AND accepted_by = %s AND status = 'accepted'
+                RETURNING *
+            """, (reason, user_id, username, datetime.now(), app_id, user_id))
+            row = await cursor.fetchone()
+        return self._cache_row(app_id, row)
     
-    def set_message_id(self, app_id, message_id):
-        with self.conn.cursor() as cursor:
-            cursor.execute("""
+    async def set_message_id(self, app_id, message_id):
+        async with self.pool.connection() as conn:
+            await conn.execute("""
                 UPDATE applications 
                 SET message_id = %s 
                 WHERE id = %s
             """, (message_id, app_id))
-            self.conn.commit()
+        self.cache.invalidate(app_id)
+    
+    async def claim_outbox(self, limit):
+        """Забирает готовые к отправке записи outbox.
+
+        Записи сразу откладываются на OUTBOX_LEASE секунд и получают +1 попытку,
+        поэтому другой relay (или этот же после рестарта) возьмет их снова,
+        только если отправка не завершилась ни успехом, ни ошибкой.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                UPDATE outbox
+                SET attempts = attempts + 1,
+                    next_attempt_at = now() + make_interval(secs => %s)
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= now()
+                    ORDER BY next_attempt_at, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            """, (Config.OUTBOX_LEASE, limit))
+            rows = await cursor.fetchall()
+        rows.sort(key=lambda row: row['id'])
+        return rows
+    
+    async def renew_outbox(self, outbox_id, attempts):
+        """Продлевает аренду записи перед отправкой.
+
+        attempts из claim_outbox служит меткой владельца: повторный захват
+        увеличивает его, и тогда продление не удастся (False).
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                UPDATE outbox
+                SET next_attempt_at = now() + make_interval(secs => %s)
+                WHERE id = %s AND attempts = %s AND sent_at IS NULL AND failed_at IS NULL
+            """, (Config.OUTBOX_LEASE, outbox_id, attempts))
+            return cursor.rowcount == 1
     
-    def get_pending_applications(self):
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("SELECT * FROM applications WHERE status = 'pending'")
-            return cursor.fetchall()
-
-    def check_application_owner(self, app_id, user_id):
-        """Проверяет, принял ли пользователь заявку"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT accepted_by FROM applications 
+    async def complete_outbox(self, outbox_id, app_id=None, message_id=None):
+        """Отмечает запись отправленной и сохраняет message_id карточки"""
+        async with self.pool.connection() as conn:
+            await conn.execute(
+                "UPDATE outbox SET sent_at = now(), last_error = NULL WHERE id = %s", (outbox_id,)
+            )
+            if app_id is not None and message_id is not None:
+                await conn.execute(
+                    "UPDATE applications SET message_id = %s WHERE id = %s", (message_id, app_id)
+                )
+        if app_id is not None:
+            self.cache.invalidate(app_id)
+    
+    async def fail_outbox(self, outbox_id, delay, error, give_up=False):
+        """Откладывает запись на delay секунд; при give_up больше не отправляет"""
+        async with self.pool.connection() as conn:
+            await conn.execute("""
+                UPDATE outbox
+                SET next_attempt_at = now() + make_interval(secs => %s),
+                    last_error = %s,
+                    failed_at = CASE WHEN %s THEN now() END
+                WHERE id = %s
+            """, (delay, error[:1000], give_up, outbox_id))
+    
+    async def load_state(self):
+        """Неистекшие состояния диалогов; expires_at - unix-время"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT namespace, key, value, extract(epoch FROM expires_at)::float8 AS expires_at
+                FROM bot_state WHERE expires_at > now()
+            """)
+            return await cursor.fetchall()
+    
+    async def save_state(self, upserts, deletes):
+        """Пакетная запись состояний диалогов в одной транзакции.
+
+        upserts - (namespace, key, value, expires_at), deletes - (namespace, key).
+        Заодно удаляет истекшие записи.
+        """
+        async with self.pool.connection() as conn:
+            if upserts:
+                namespaces, keys, values, expires = zip(*upserts)
+                await conn.execute("""
+                    INSERT INTO bot_state (namespace, key, value, expires_at)
+                    SELECT namespace, key, value::jsonb, to_timestamp(expires_at)
+                    FROM unnest(%s::varchar[], %s::varchar[], %s::text[], %s::float8[])
+                        AS t(namespace, key, value, expires_at)
+                    ON CONFLICT (namespace, key) DO UPDATE
+                    SET value = EXCLUDED.value,
+                        expires_at = EXCLUDED.expires_at,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (list(namespaces), list(keys),
+                      [orjson.dumps(value).decode() for value in values], list(expires)))
+            if deletes:
+                namespaces, keys = zip(*deletes)
+                await conn.execute("""
+                    DELETE FROM bot_state
+                    WHERE (namespace, key) IN (
+                        SELECT * FROM unnest(%s::varchar[], %s::varchar[])
+                    )
+                """, (list(namespaces), list(keys)))
+            await conn.execute("DELETE FROM bot_state WHERE expires_at <= now()")
+    
+    async def get_state_value(self, namespace, key):
+        """Неистекшее значение записи bot_state или None.
+
+        Для значений, которые должны переживать перезапуск при любом
+        STATE_BACKEND (отметка работы бота для catchup).
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT value FROM bot_state
+                WHERE namespace = %s AND key = %s AND expires_at > now()
+            """, (namespace, key))
+            row = await cursor.fetchone()
+            return row['value'] if row else None
+    
+    async def set_state_value(self, namespace, key, value, ttl):
+        """Записывает значение в bot_state на ttl секунд"""
+        async with self.pool.connection() as conn:
+            await conn.execute("""
+                INSERT INTO bot_state (namespace, key, value, expires_at)
+                VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (namespace, key) DO UPDATE
+                SET value = EXCLUDED.value,
+                    expires_at = EXCLUDED.expires_at,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (namespace, key, Jsonb(value), ttl))
+    
+    async def get_pending_applications(self):
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("SELECT * FROM applications WHERE status = 'pending'")
+            return await cursor.fetchall()
+
+    async def check_application_owner(self, app_id, user_id):
+        """Проверяет, принял ли пользователь заявку.
+
+        Проверка доступа к телефону и адресу читает БД, а не кэш: строку
+        могли изменить другие процессы, не сбрасывающие кэш этого.
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT 1 FROM applications
                 WHERE id = %s AND accepted_by = %s AND status = 'accepted'
             """, (app_id, user_id))
-            result = cursor.fetchone()
-            return result is not None
-
-    def get_user_accepted_applications(self, user_id):
-        """Получить заявки, принятые пользователем"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT * FROM applications 
+            return await cursor.fetchone() is not None
+
+    async def get_photo_file_id(self, digest):
+        """file_id ранее загруженного фото по sha256 содержимого"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT file_id FROM photo_files WHERE sha256 = %s", (digest,)
+            )
+            row = await cursor.fetchone()
+            return row['file_id'] if row else None
+    
+    async def save_photo_file_id(self, digest, file_id):
+        """Запоминает file_id загруженного фото"""
+        async with self.pool.connection() as conn:
+            await conn.execute("""
+                INSERT INTO photo_files (sha256, file_id) VALUES (%s, %s)
+                ON CONFLICT (sha256) DO NOTHING
+            """, (digest, file_id))
+
+    async def _fetch_page(self, columns, where, params, limit, cursor, backward):
+        """Keyset-пагинация по (created_at, id), от новых к старым.
+
+        cursor - (created_at, id) строки на границе страницы. Без backward
+        возвращает строки старше курсора, с backward - новее.
+        Возвращает (rows, has_more), где has_more означает, что в выбранном
+        направлении есть еще строки.
+        """
+        if cursor is None:
+            condition, order = "", "DESC"
+        elif backward:
+            condition, order = "AND (created_at, id) > (%s, %s)", "ASC"
+            params = (*params, *cursor)
+        else:
+            condition, order = "AND (created_at, id) < (%s, %s)", "DESC"
+            params = (*params, *cursor)
+        async with self.pool.connection() as conn:
+            result = await conn.execute(f"""
+                SELECT {columns} FROM applications
+                WHERE {where} {condition}
+                ORDER BY created_at {order}, id {order}
+                LIMIT %s
+            """, (*params, limit + 1))
+            rows = await result.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward and cursor is not None:
+            rows.reverse()
+        return rows, has_more
+
+    async def get_user_accepted_applications(self, user_id, limit=None, cursor=None, backward=False):
+        """Получить страницу заявок, принятых пользователем"""
+        return await self._fetch_page(
+            "id, address, task, created_at",
+            "accepted_by = %s AND status = 'accepted'", (user_id,),
+            limit or Config.PAGE_SIZE, cursor, backward
+        )
+    
+    async def count_user_accepted_applications(self, user_id):
+        """Количество заявок, принятых пользователем"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT count(*) AS total FROM applications 
                 WHERE accepted_by = %s AND status = 'accepted'
-                ORDER BY created_at DESC
             """, (user_id,))
-            return cursor.fetchall()
+            row = await cursor.fetchone()
+            return row['total']
+    
+    async def get_user_created_applications(self, user_id, limit=None, cursor=None, backward=False):
+        """Получить страницу заявок, созданных пользователем"""
+        return await self._fetch_page(
+            "id, address, task, status, accepted_username, created_at",
+            "user_id = %s AND status IN ('pending', 'accepted')", (user_id,),
+            limit or Config.PAGE_SIZE, cursor, backward
+        )
     
-    def get_user_created_applications(self, user_id):
-        """Получить заявки, созданные пользователем"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT * FROM applications 
+    async def count_user_created_applications(self, user_id):
+        """Количество активных заявок пользователя по статусам"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT count(*) FILTER (WHERE status = 'pending') AS pending,
+                       count(*) FILTER (WHERE status = 'accepted') AS accepted
+                FROM applications 
                 WHERE user_id = %s AND status IN ('pending', 'accepted')
-                ORDER BY created_at DESC
             """, (user_id,))
-            return cursor.fetchall()
+            return await cursor.fetchone()
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(row):
+    """Курсор страницы для callback_data: '<микросекунды created_at>_<id>'"""
+    micros = (row['created_at'] - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{row['id']}"
+
+
+def decode_cursor(value):
+    """Обратное к encode_cursor преобразование, ValueError при неверном формате"""
+    micros, app_id = value.split('_')
+    return _EPOCH + timedelta(microseconds=int(micros)), int(app_id)
 
 
-db = Database()
\ No newline at end of file
+# Пул открывается в post_init бота (await db.connect())
+db = Database()
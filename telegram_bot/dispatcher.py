@@ -0,0 +1,130 @@
+"""Общий асинхронный диспетчер исходящих запросов к Telegram"""
+import asyncio
+import logging
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+from config import Config
+from ratelimit import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class DispatcherFull(Exception):
+    """Очередь диспетчера заполнена"""
+
+
+class OutboundDispatcher:
+    """Ограниченная очередь задач и пул воркеров над одним экземпляром Bot.
+
+    Задача - корутинная функция, первым аргументом получающая ``bot``.
+    Все воркеры используют один Bot и, значит, один пул HTTP-соединений.
+
+    Лимиты Telegram соблюдает общий ``rate_limiter`` бота, через который
+    идут все запросы; если RetryAfter все же дошел до задачи, она повторяется.
+
+    Если передан ``bot``, диспетчер использует его (например, бот приложения
+    PTB) и не инициализирует/не останавливает его сам.
+    """
+
+    def __init__(self, token=None, workers=None, queue_size=None, max_retries=3, bot=None):
+        self.token = token or Config.BOT_TOKEN
+        self.workers = workers or Config.DISPATCHER_WORKERS
+        self.queue_size = queue_size or Config.DISPATCHER_QUEUE_SIZE
+        self.max_retries = max_retries
+        self.bot = bot
+        self._own_bot = bot is None
+        self._queue = None
+        self._tasks = []
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+
+    async def start(self):
+        """Создает Bot (если не передан) и запускает воркеры в текущем event loop"""
+        if self._own_bot:
+            self.bot = ExtBot(
+                token=self.token,
+                request=HTTPXRequest(connection_pool_size=self.workers + 4),
+                rate_limiter=rate_limiter
+            )
+            await self.bot.initialize()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'dispatcher-{i}')
+            for i in range(self.workers)
+        ]
+        logger.info(f"Диспетчер запущен: воркеров {self.workers}, очередь {self.queue_size}")
+
+    async def stop(self, timeout=10):
+        """Дожидается обработки очереди (не дольше timeout) и останавливает воркеры"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Диспетчер остановлен с {self._queue.qsize()} задачами в очереди")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._own_bot:
+            await self.bot.shutdown()
+
+    def is_full(self):
+        return self._queue is None or self._queue.full()
+
+    def free_slots(self):
+        """Сколько задач еще поместится в очередь"""
+        if self._queue is None:
+            return 0
+        return self.queue_size - self._queue.qsize()
+
+    def submit(self, job, *args):
+        """Ставит задачу в очередь, DispatcherFull если места нет"""
+        if self._queue is None:
+            raise DispatcherFull("Диспетчер не запущен")
+        try:
+            self._queue.put_nowait((job, args))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise DispatcherFull("Очередь отправки заполнена") from None
+        self.submitted += 1
+
+    async def _worker(self):
+        while True:
+            job, args = await self._queue.get()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    # Ожидание после RetryAfter выдерживает rate_limiter
+                    try:
+                        await job(self.bot, *args)
+                        break
+                    except RetryAfter as e:
+                        if attempt == self.max_retries:
+                            raise
+                        logger.warning(f"Flood control Telegram, повторяем задачу через {e.retry_after} с")
+                        self.retried += 1
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка задачи {getattr(job, '__name__', job)}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        """Метрики очереди"""
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'queue_size': self.queue_size,
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'retried': self.retried,
+        }
@@ -36,7 +36,18 @@ wait_for_postgres() {
 }
 
 # Запуск приложения
-if [ "$1" = "bot" ]; then
+if [ "$1" = "all" ]; then
+    wait_for_postgres
+    if [ $? -ne 0 ]; then
+        echo "Failed to connect to PostgreSQL. Exiting."
+        exit 1
+    fi
+    
+    # Бот и HTTP-сервер в одном процессе и одном event loop
+    echo "Starting Telegram Bot and HTTP API..."
+    exec python main.py all
+    
+elif [ "$1" = "bot" ]; then
     wait_for_postgres
     if [ $? -ne 0 ]; then
         echo "Failed to connect to PostgreSQL. Exiting."
@@ -44,7 +55,19 @@ if [ "$1" = "bot" ]; then
     fi
     
     echo "Starting Telegram Bot..."
-    exec python main.py
+    exec python main.py bot
+    
+elif [ "$1" = "api" ]; then
+    wait_for_postgres
+    if [ $? -ne 0 ]; then
+        echo "Failed to connect to PostgreSQL. Exiting."
+        exit 1
+    fi
+    
+    # Карточки из outbox отправляет процесс бота, API только принимает заявки
+    # (API_OUTBOX_RELAY=false по умолчанию в config.py)
+    echo "Starting HTTP API with ${API_WORKERS:-1} workers..."
+    exec uvicorn webhook:app --host 0.0.0.0 --port ${API_PORT:-7000} --workers ${API_WORKERS:-1}
     
 elif [ "$1" = "debug" ]; then
     wait_for_postgres
@@ -57,6 +80,6 @@ elif [ "$1" = "debug" ]; then
     exec python debug.py
     
 else
-    echo "Please specify mode: 'bot' or 'debug'"
+    echo "Please specify mode: 'all', 'bot', 'api' or 'debug'"
     exit 1
 fi
\ No newline at end of file
@@ -1,16 +1,48 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from config import Config
 from models import Application
-from database import db
+from database import db, encode_cursor, decode_cursor
+from state_store import state_store
+from tokens import make_token, verify_token, InvalidToken, TokenExpired
+import callbacks
+from callbacks import encode as encode_callback, parse as parse_callback
+from cards import CARD_ACCEPTED, CARD_CLOSED, render_card
 from keyboards import *
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Простое хранилище состояний
-user_states = {}
+
+async def fan_out(summary, **sends):
+    """Выполняет независимые отправки параллельно.
+
+    Ошибка одной отправки не мешает остальным. Корутина может вернуть
+    строку - она попадет в итог вместо "ok". Итог пишется одной строкой лога.
+    """
+    results = await asyncio.gather(*sends.values(), return_exceptions=True)
+    parts = []
+    for name, result in zip(sends, results):
+        if isinstance(result, BaseException):
+            parts.append(f"{name}=ошибка ({result})")
+        else:
+            parts.append(f"{name}={result or 'ok'}")
+    logger.info(f"{summary}: {', '.join(parts)}")
+    return dict(zip(sends, results))
+
+# Состояния диалога создания заявки (TTL, сохраняются в БД, см. state_store)
+user_states = state_store.map('create')
+
+def conversation_timeout(states):
+    """Обработчик ConversationHandler.TIMEOUT: забывает состояние брошенного диалога"""
+    async def on_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if isinstance(update, Update) and update.effective_user:
+            logger.info(f"Диалог пользователя {update.effective_user.id} завершен по таймауту")
+            states.pop(update.effective_user.id)
+    return on_timeout
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,12 +65,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     except:
                         pass
                 elif arg.startswith('token_'):
-                    token_data = arg.split('_')[1]
+                    # В base64url-токене может быть '_', поэтому не split
+                    token_data = arg[len('token_'):]
                     break
         
         from keyboards import get_private_chat_keyboard
 
-        keyboard = [[InlineKeyboardButton("Создать заявку", callback_data='create_application')]]
+        keyboard = [[InlineKeyboardButton("Создать заявку", callback_data=encode_callback(callbacks.CREATE))]]
         
         welcome_text = (
             "Привет! Я бот для управления заявками.\n\n"
@@ -49,23 +82,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         # Если пользователь пришел по токену
-        if token_data and 'app_tokens' in context.bot_data:
-            token_info = context.bot_data['app_tokens'].get(token_data)
+        if token_data:
+            # Токен подписан и содержит срок действия - проверяем без хранилища
+            token_info = None
+            try:
+                token_app_id, token_user_id = verify_token(token_data)
+                token_info = {'app_id': token_app_id, 'user_id': token_user_id}
+            except TokenExpired:
+                await update.message.reply_text(
+                    "❌ Срок действия ссылки истек.\n"
+                    "Пожалуйста, примите заявку заново в группе.",
+                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                return ConversationHandler.END
+            except InvalidToken as e:
+                logger.warning(f"Неверный токен в /start: {e}")
             
             if token_info:
-                # Проверяем срок действия токена
-                import time
-                if time.time() > token_info['expires']:
-                    await update.message.reply_text(
-                        "❌ Срок действия ссылки истек.\n"
-                        "Пожалуйста, примите заявку заново в группе.",
-                        reply_markup=InlineKeyboardMarkup(keyboard),
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    # Удаляем просроченный токен
-                    del context.bot_data['app_tokens'][token_data]
-                    return ConversationHandler.END
-                
                 # Проверяем, что токен предназначен этому пользователю
                 if token_info['user_id'] != user_id:
                     await update.message.reply_text(
@@ -78,11 +112,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 # Получаем данные заявки
                 app_data = token_info['app_id']
-                application = db.get_application(app_data)
+                application = await db.get_application(app_data)
                 
                 if application:
                     # Проверяем, принял ли этот пользователь заявку
-                    is_accepted_by_user = db.check_application_owner(app_data, user_id)
+                    is_accepted_by_user = await db.check_application_owner(app_data, user_id)
                     
                     if not is_accepted_by_user:
                         await update.message.reply_text(
@@ -123,21 +157,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             caption=f"Фото к заявке #{app_data}"
                         )
                     
-                    # Удаляем использованный токен
-                    del context.bot_data['app_tokens'][token_data]
-                
+
                     # Добавляем кнопку для сохранения контакта
                     contact_keyboard = [
-                        [InlineKeyboardButton("📝 Создать свою заявку", callback_data='create_application')],
+                        [InlineKeyboardButton("📝 Создать свою заявку", callback_data=encode_callback(callbacks.CREATE))],
                     ]
                     return ConversationHandler.END
         
         # Если пользователь пришел по прямой ссылке с номером заявки
         if app_data:
-            application = db.get_application(app_data)
+            application = await db.get_application(app_data)
             if application:
                 # Проверяем, принял ли этот пользователь заявку
-                is_accepted_by_user = db.check_application_owner(app_data, user_id)
+                is_accepted_by_user = await db.check_application_owner(app_data, user_id)
                 
                 if not is_accepted_by_user:
                     await update.message.reply_text(
@@ -181,7 +213,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 # Добавляем кнопку для сохранения контакта
                 contact_keyboard = [
-                    [InlineKeyboardButton("📝 Создать свою заявку", callback_data='create_application')],
+                    [InlineKeyboardButton("📝 Создать свою заявку", callback_data=encode_callback(callbacks.CREATE))],
                 ]
                 return ConversationHandler.END
         
@@ -302,8 +334,7 @@ async def handle_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"DEBUG: Сохраняем адрес: {text}")
     
     # Сохраняем адрес
-    user_states[user_id]['address'] = text
-    user_states[user_id]['step'] = 'phone'
+    user_states.update(user_id, address=text, step='phone')
     
     await update.message.reply_text(
         "Шаг 2 из 5: Введите номер телефона:\n"
@@ -334,8 +365,7 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     phone = text.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
     
     # Сохраняем телефон
-    user_states[user_id]['phone'] = phone
-    user_states[user_id]['step'] = 'task'
+    user_states.update(user_id, phone=phone, step='task')
     
     await update.message.reply_text(
         "Шаг 3 из 5: Опишите задачу:\n"
@@ -363,8 +393,7 @@ async def handle_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"DEBUG: Сохраняем задачу: {text}")
     
     # Сохраняем задачу
-    user_states[user_id]['task'] = text
-    user_states[user_id]['step'] = 'comment'
+    user_states.update(user_id, task=text, step='comment')
     
     await update.message.reply_text(
         "Шаг 4 из 5: Введите комментарий:\n"
@@ -394,8 +423,7 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Сохраняем комментарий
     comment = text if text != '-' else ""
-    user_states[user_id]['comment'] = comment
-    user_states[user_id]['step'] = 'photo_choice'
+    user_states.update(user_id, comment=comment, step='photo_choice')
     
     # Спрашиваем, нужно ли добавить фото
     await update.message.reply_text(
@@ -423,7 +451,7 @@ async def handle_photo_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if choice in ['да', '✅ да', 'yes']:
         # Пользователь хочет добавить фото
-        user_states[user_id]['need_photo'] = True
+        user_states.update(user_id, need_photo=True)
         await update.message.reply_text(
             "📸 Отправьте фото:",
             reply_markup=get_cancel_keyboard()
@@ -431,8 +459,7 @@ async def handle_photo_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
         return Config.PHOTO  # Остаемся в том же состоянии, но теперь ожидаем фото
     else:
         # Пользователь не хочет добавлять фото
-        user_states[user_id]['need_photo'] = False
-        user_states[user_id]['photo_file_id'] = None
+        user_states.update(user_id, need_photo=False, photo_file_id=None)
         # Сохраняем заявку без фото
         return await save_application(update, context)
 
@@ -451,7 +478,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.photo:
         # Берем фото в максимальном размере (последнее в списке)
         photo_file_id = update.message.photo[-1].file_id
-        user_states[user_id]['photo_file_id'] = photo_file_id
+        user_states.update(user_id, photo_file_id=photo_file_id)
         
         # Подтверждаем получение фото
         await update.message.reply_text(
@@ -500,8 +527,9 @@ async def save_application(update: Update, context: ContextTypes.DEFAULT_TYPE):
             photo_file_id=user_data.get('photo_file_id')
         )
         
-        # Сохраняем в БД
-        app_id = db.create_application(application)
+        # Сохраняем в БД; карточку в группу отправит relay outbox,
+        # запись в который создается в той же транзакции
+        app_id = await db.create_application(application)
         print(f"DEBUG: Заявка #{app_id} создана")
         
         # Подтверждение пользователю
@@ -517,55 +545,6 @@ async def save_application(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=remove_keyboard()
         )
-        
-        # Создаем клавиатуру для заявки
-        keyboard = get_application_keyboard(app_id)
-        
-        # Формируем текст с комментарием
-        message_text = (
-            f"Новая заявка #{app_id}\n\n"
-            f"Адрес: {application.address}\n"
-            f"Задача: {application.task}\n"
-        )
-        
-        # Добавляем комментарий, если он есть
-        if application.comment and application.comment.strip():
-            message_text += f"Комментарий: {application.comment}\n"
-        
-        # Добавляем информацию об отправителе
-        message_text += f"От: @{application.username}"
-        
-        # Отправляем заявку в группу
-        try:
-            if application.photo_file_id:
-                # Если есть фото - отправляем с caption
-                sent_message = await context.bot.send_photo(
-                    chat_id=Config.ADMIN_GROUP_CHAT_ID,
-                    photo=application.photo_file_id,
-                    caption=message_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                # Сохраняем информацию, что это сообщение с фото
-                context.bot_data[f'app_{app_id}_has_photo'] = True
-            else:
-                # Если нет фото - отправляем текстовое сообщение
-                sent_message = await context.bot.send_message(
-                    chat_id=Config.ADMIN_GROUP_CHAT_ID,
-                    text=message_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                context.bot_data[f'app_{app_id}_has_photo'] = False
-            
-            # Сохраняем ID сообщения в базе данных
-            db.set_message_id(app_id, sent_message.message_id)
-            
-        except Exception as e:
-            print(f"DEBUG: Ошибка при отправке в группу: {e}")
-            await update.message.reply_text(
-                "❌ Ошибка при отправке заявки в группу. Администратор уведомлен."
-            )
                 
     except Exception as e:
         print(f"DEBUG: Ошибка при сохранении заявки: {e}")
@@ -594,7 +573,7 @@ async def handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Создаем кнопку для новой заявки
-    keyboard = [[InlineKeyboardButton("📝 Создать заявку", callback_data='create_application')]]
+    keyboard = [[InlineKeyboardButton("📝 Создать заявку", callback_data=encode_callback(callbacks.CREATE))]]
     
     await update.message.reply_text(
         "Можете создать новую заявку:",
@@ -610,57 +589,44 @@ async def handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def accept_application_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик принятия заявки"""
     query = update.callback_query
-    await query.answer()
     
-    app_id = int(query.data.split('_')[1])
-    application = db.get_application(app_id)
+    app_id = parse_callback(query).args[0]
     user_id = query.from_user.id
     
-    if not application:
-        await query.edit_message_text("❌ Заявка не найдена.")
-        return
-    
-    success = db.accept_application(
+    # Проверка статуса и принятие выполняются одним запросом:
+    # если заявку уже принял кто-то другой, получим None
+    application = await db.accept_application(
         app_id, 
         user_id,
         query.from_user.username or query.from_user.full_name
     )
     
-    if success:
-        # Формируем новый текст для сообщения
-        new_text = (
-            f"Заявка #{app_id} ПРИНЯТА\n\n"
-            f"Адрес: {application['address']}\n"
-            f"Задача: {application['task']}\n"
-        )
-        
-        # Добавляем комментарий, если он есть
-        if application['comment'] and application['comment'].strip():
-            new_text += f"Комментарий: {application['comment']}\n"
+    if application:
+        await query.answer()
         
-        # Добавляем информацию об отправителе и исполнителе
-        new_text += f"От: @{application['username']}\n"
-        new_text += f"Принял: @{query.from_user.username or query.from_user.full_name}"
+        # Новый текст карточки; у карточки с фото это подпись
+        new_text = render_card(application, CARD_ACCEPTED, caption=bool(application.get('photo_file_id')))
         
-        try:
-            # Проверяем, было ли сообщение с фото или текстом
-            if application.get('photo_file_id'):
-                # Если это было сообщение с фото, редактируем caption
-                await query.edit_message_caption(
-                    caption=new_text,
-                    reply_markup=None  # Убираем клавиатуру
-                )
-            else:
-                # Если это было текстовое сообщение, редактируем текст
-                await query.edit_message_text(
-                    text=new_text,
-                    reply_markup=None,  # Убираем клавиатуру
-                    parse_mode=ParseMode.MARKDOWN
-                )
-        except Exception as e:
-            print(f"DEBUG: Ошибка при редактировании сообщения: {e}")
-            # Если не удалось отредактировать, пробуем отправить новое сообщение
+        async def update_group_card():
             try:
+                # Проверяем, было ли сообщение с фото или текстом
+                if application.get('photo_file_id'):
+                    # Если это было сообщение с фото, редактируем caption
+                    await query.edit_message_caption(
+                        caption=new_text,
+                        reply_markup=None,  # Убираем клавиатуру
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                else:
+                    # Если это было текстовое сообщение, редактируем текст
+                    await query.edit_message_text(
+                        text=new_text,
+                        reply_markup=None,  # Убираем клавиатуру
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+            except Exception as e:
+                logger.warning(f"Ошибка при редактировании сообщения: {e}", exc_info=True)
+                # Если не удалось отредактировать, отправляем новое сообщение
                 if application.get('photo_file_id'):
                     await context.bot.send_photo(
                         chat_id=Config.ADMIN_GROUP_CHAT_ID,
@@ -674,80 +640,68 @@ async def accept_application_callback(update: Update, context: ContextTypes.DEFA
                         text=new_text,
                         parse_mode=ParseMode.MARKDOWN
                     )
-            except Exception as e2:
-                print(f"DEBUG: Не удалось отправить новое сообщение: {e2}")
+                return "новое сообщение"
         
-        # Пытаемся отправить данные в личку с кнопками
-        try:
-            # Импортируем клавиатуру управления заявкой
-            from keyboards import get_application_management_keyboard
-            
-            full_info = (
-                f"Вы приняли заявку #{app_id}!\n\n"
-                f"Данные заявки:\n"
-                f"Адрес: {application['address']}\n"
-                f"Телефон: {application['phone']}\n"
-                f"Задача: {application['task']}\n"
-                f"Комментарий: {application['comment'] or 'нет'}\n"
-                f"Отправитель: @{application['username']}\n\n"
-                f"Если по какой-то причине вы не можете выполнить заявку, "
-                f"вы можете вернуть ее в общий чат или закрыть после выполнения."
-            )
-            
-            # Отправляем сообщение в личку с кнопками управления
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=full_info,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=get_application_management_keyboard(app_id)
-            )
+        async def notify_executor():
+            # Пытаемся отправить данные в личку с кнопками
+            try:
+                # Импортируем клавиатуру управления заявкой
+                from keyboards import get_application_management_keyboard
+                
+                full_info = (
+                    f"Вы приняли заявку #{app_id}!\n\n"
+                    f"Данные заявки:\n"
+                    f"Адрес: {application['address']}\n"
+                    f"Телефон: {application['phone']}\n"
+                    f"Задача: {application['task']}\n"
+                    f"Комментарий: {application['comment'] or 'нет'}\n"
+                    f"Отправитель: @{application['username']}\n\n"
+                    f"Если по какой-то причине вы не можете выполнить заявку, "
+                    f"вы можете вернуть ее в общий чат или закрыть после выполнения."
+                )
+                
+                # Отправляем сообщение в личку с кнопками управления
+                await context.bot.send_message(
+                    chat_id=user_id,
+                    text=full_info,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=get_application_management_keyboard(app_id)
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось отправить в личку: {e}", exc_info=True)
+                await send_start_link()
+                return "ссылка"
             
-            # Если есть фото, отправляем его в личку
+            # Фото в личку и сообщение в группе, что данные отправлены, независимы
+            sends = {}
             if application.get('photo_file_id'):
-                await context.bot.send_photo(
+                sends['photo'] = context.bot.send_photo(
                     chat_id=user_id,
                     photo=application['photo_file_id'],
                     caption=f"Фото к заявке #{app_id}"
                 )
-            
-            # Сообщение в группе, что данные отправлены
-            await query.message.reply_text(
+            sends['reply'] = query.message.reply_text(
                 f"{query.from_user.username or query.from_user.full_name}, "
                 f"данные заявки #{app_id} отправлены вам в личные сообщения.",
                 parse_mode=ParseMode.MARKDOWN,
                 reply_to_message_id=query.message.message_id
             )
-            
-        except Exception as e:
-            print(f"DEBUG: Не удалось отправить в личку: {e}")
-            
-            # Создаем ссылку с временным токеном
-            import hashlib
-            import time
-            
-            # Создаем уникальный токен для этой заявки и пользователя
-            token_data = f"{app_id}_{user_id}_{int(time.time())}"
-            token_hash = hashlib.md5(token_data.encode()).hexdigest()[:8]
-            
-            # Сохраняем в контексте временную связку токен-пользователь-заявка
-            if 'app_tokens' not in context.bot_data:
-                context.bot_data['app_tokens'] = {}
-            
-            # Сохраняем на 1 час (3600 секунд)
-            context.bot_data['app_tokens'][token_hash] = {
-                'app_id': app_id,
-                'user_id': user_id,
-                'expires': time.time() + 3600
-            }
+            results = await asyncio.gather(*sends.values(), return_exceptions=True)
+            failed = [name for name, result in zip(sends, results) if isinstance(result, BaseException)]
+            return f"личка (ошибки: {', '.join(failed)})" if failed else "личка"
+        
+        async def send_start_link():
+            # Подписанный токен на 1 час: хранить его на сервере не нужно
+            token = make_token(app_id, user_id, ttl=3600)
             
             # Создаем кнопку для начала диалога с ботом
             start_button = InlineKeyboardButton(
                 "💬 Получить данные заявки", 
-                url=f"https://t.me/{context.bot.username}?start=token_{token_hash}"
+                url=f"https://t.me/{context.bot.username}?start=token_{token}"
             )
             keyboard = InlineKeyboardMarkup([[start_button]])
             
-            reply_msg = await query.message.reply_text(
+            await query.message.reply_text(
                 f"{query.from_user.username or query.from_user.full_name}, "
                 f"вы приняли заявку #{app_id}, но у вас нет диалога с ботом.\n\n"
                 f"Чтобы получить данные заявки:\n"
@@ -759,27 +713,23 @@ async def accept_application_callback(update: Update, context: ContextTypes.DEFA
                 parse_mode=ParseMode.MARKDOWN,
                 reply_to_message_id=query.message.message_id
             )
-            
-            # Сохраняем ID сообщения
-            context.bot_data[f'app_{app_id}_message'] = {
-                'message_id': reply_msg.message_id,
-                'chat_id': query.message.chat.id,
-                'user_id': user_id
-            }
         
+        # Правка карточки, данные исполнителю и уведомление создателя независимы
+        sends = {
+            'group': update_group_card(),
+            'executor': notify_executor(),
+        }
         # Уведомляем создателя заявки
         if user_id != application['user_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=application['user_id'],
-                    text=f"✅ Ваша заявка #{app_id} принята!\n"
-                         f"Исполнитель: @{query.from_user.username or query.from_user.full_name}\n\n"
-                         f"Скоро с вами свяжутся для уточнения деталей."
-                )
-            except Exception as e:
-                print(f"DEBUG: Не удалось уведомить создателя: {e}")
+            sends['creator'] = context.bot.send_message(
+                chat_id=application['user_id'],
+                text=f"✅ Ваша заявка #{app_id} принята!\n"
+                     f"Исполнитель: @{query.from_user.username or query.from_user.full_name}\n\n"
+                     f"Скоро с вами свяжутся для уточнения деталей."
+            )
+        await fan_out(f"Заявка #{app_id} принята", **sends)
     else:
-        await query.answer("⚠️ Не удалось принять заявку!", show_alert=True)
+        await query.answer("⚠️ Не удалось принять заявку: она уже принята или не найдена.", show_alert=True)
 
 
 async def handle_cancel_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -799,7 +749,7 @@ async def handle_cancel_button(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     
     # Создаем кнопку для новой заявки
-    keyboard = [[InlineKeyboardButton("📝 Создать заявку", callback_data='create_application')]]
+    keyboard = [[InlineKeyboardButton("📝 Создать заявку", callback_data=encode_callback(callbacks.CREATE))]]
     
     await update.message.reply_text(
         "Можете создать новую заявку:",
@@ -865,21 +815,17 @@ async def save_contact_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.edit_message_text("❌ Ошибка: неверный ID заявки.")
-        return
+    app_id = parse_callback(query).args[0]
     
     # Проверяем, имеет ли пользователь доступ к этой заявке
     user_id = query.from_user.id
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     
     if not is_accepted_by_user:
         await query.answer("❌ У вас нет доступа к этой заявке", show_alert=True)
         return
     
-    application = db.get_application(app_id)
+    application = await db.get_application(app_id)
     
     if not application:
         await query.edit_message_text("❌ Заявка не найдена.")
@@ -900,13 +846,13 @@ async def save_contact_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Добавляем кнопки для копирования данных
     keyboard = [
-        [InlineKeyboardButton("📞 Скопировать номер", callback_data=f'copy_phone_{app_id}')],
-        [InlineKeyboardButton("📍 Скопировать адрес", callback_data=f'copy_address_{app_id}')],
+        [InlineKeyboardButton("📞 Скопировать номер", callback_data=encode_callback(callbacks.COPY, 'phone', app_id))],
+        [InlineKeyboardButton("📍 Скопировать адрес", callback_data=encode_callback(callbacks.COPY, 'address', app_id))],
         [
-            InlineKeyboardButton("🔄 Вернуть заявку", callback_data=f'return_app_{app_id}'),
-            InlineKeyboardButton("🔒 Закрыть заявку", callback_data=f'close_app_{app_id}')
+            InlineKeyboardButton("🔄 Вернуть заявку", callback_data=encode_callback(callbacks.RETURN, app_id)),
+            InlineKeyboardButton("🔒 Закрыть заявку", callback_data=encode_callback(callbacks.CLOSE, app_id))
         ],
-        [InlineKeyboardButton("📝 Создать свою заявку", callback_data='create_application')]
+        [InlineKeyboardButton("📝 Создать свою заявку", callback_data=encode_callback(callbacks.CREATE))]
     ]
     
     await query.message.reply_text(
@@ -919,23 +865,17 @@ async def copy_data_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    data = query.data.split('_')
-    if len(data) < 3:
-        await query.answer("❌ Ошибка данных", show_alert=True)
-        return
-    
-    action = data[1]  # phone или address
-    app_id = int(data[2])
+    action, app_id = parse_callback(query).args  # phone или address
     
     # Проверяем, имеет ли пользователь доступ к этой заявке
     user_id = query.from_user.id
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     
     if not is_accepted_by_user:
         await query.answer("❌ У вас нет доступа к этой заявке", show_alert=True)
         return
     
-    application = db.get_application(app_id)
+    application = await db.get_application(app_id)
     
     if not application:
         await query.answer("❌ Заявка не найдена", show_alert=True)
@@ -944,12 +884,9 @@ async def copy_data_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if action == 'phone':
         text_to_copy = application['phone']
         message = f"📞 Номер телефона скопирован: `{text_to_copy}`"
-    elif action == 'address':
+    else:
         text_to_copy = application['address']
         message = f"📍 Адрес скопирован: `{text_to_copy}`"
-    else:
-        await query.answer("❌ Неизвестное действие", show_alert=True)
-        return
     
     await query.answer(f"✅ {text_to_copy}", show_alert=True)
     
@@ -960,23 +897,19 @@ async def copy_data_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 
-# Глобальные переменные для состояний возврата заявки
-return_states = {}
+# Состояния возврата заявки
+return_states = state_store.map('return')
 
 async def return_application_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопки 'Вернуть заявку'"""
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     # Проверяем, принял ли этот пользователь заявку
     user_id = query.from_user.id
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     
     if not is_accepted_by_user:
         await query.answer("❌ Только исполнитель, принявший заявку, может вернуть ее", show_alert=True)
@@ -990,7 +923,7 @@ async def return_application_callback(update: Update, context: ContextTypes.DEFA
     }
     
     # Запрашиваем причину возврата
-    keyboard = [[InlineKeyboardButton("❌ Отмена возврата", callback_data=f'cancel_return_{app_id}')]]
+    keyboard = [[InlineKeyboardButton("❌ Отмена возврата", callback_data=encode_callback(callbacks.CANCEL_RETURN, app_id))]]
     
     # Отправляем запрос причины в ЛИЧНЫЕ сообщения
     try:
@@ -1002,10 +935,10 @@ async def return_application_callback(update: Update, context: ContextTypes.DEFA
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         # Сохраняем ID личного сообщения
-        return_states[user_id]['private_message_id'] = msg.message_id
+        return_states.update(user_id, private_message_id=msg.message_id)
         await query.answer("💬 Проверьте личные сообщения для указания причины", show_alert=True)
     except Exception as e:
-        print(f"DEBUG: Не удалось отправить запрос в личку: {e}")
+        logger.warning(f"Не удалось отправить запрос в личку: {e}", exc_info=True)
         # Если не удалось в личку, просим в группе
         reply_msg = await query.message.reply_text(
             f"📝 Возврат заявки #{app_id}\n\n"
@@ -1014,110 +947,68 @@ async def return_application_callback(update: Update, context: ContextTypes.DEFA
             reply_markup=InlineKeyboardMarkup(keyboard),
             reply_to_message_id=query.message.message_id
         )
-        return_states[user_id]['group_message_id'] = reply_msg.message_id
+        return_states.update(user_id, group_message_id=reply_msg.message_id)
+    
+    # Следующее текстовое сообщение пользователя в личке - причина возврата
+    return Config.RETURN_REASON
 
 async def handle_return_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка причины возврата заявки"""
+    """Обработка причины возврата заявки (состояние RETURN_REASON, только личный чат)"""
     user_id = update.effective_user.id
     
-    # Дополнительная проверка, что это личный чат
-    if update.effective_chat.type != 'private':
-        return  # Просто игнорируем сообщения в группах
-    
     if user_id not in return_states:
-        # Не отправляем сообщение, если нет активного процесса
-        return
+        # Состояние истекло - завершаем диалог, текст ничего не делает
+        return ConversationHandler.END
     
     reason = update.message.text
     app_data = return_states[user_id]
     app_id = app_data['app_id']
     
-    # Проверяем, имеет ли пользователь право вернуть заявку
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
-    if not is_accepted_by_user:
-        await update.message.reply_text("❌ Вы не можете вернуть эту заявку.")
-        # Очищаем состояние
-        if user_id in return_states:
-            del return_states[user_id]
-        return ConversationHandler.END
-    
-    # Обновляем заявку в базе данных
-    success = db.return_application(
+    # Возвращаем заявку; право на возврат проверяется в том же запросе.
+    # Получаем обновленные данные заявки или None
+    application = await db.return_application(
         app_id, 
         user_id,
         update.effective_user.username or update.effective_user.full_name,
         reason
     )
     
-    if success:
-        # Удаляем старое сообщение в группе (если возможно)
-        try:
-            await context.bot.delete_message(
+    if application:
+        async def delete_private_prompt():
+            # Удаляем сообщение с кнопками возврата
+            if app_data.get('private_message_id'):
+                await context.bot.delete_message(
+                    chat_id=user_id,
+                    message_id=app_data['private_message_id']
+                )
+        
+        # Новую карточку с причиной возврата отправит relay outbox,
+        # остальные отправки независимы и идут параллельно
+        sends = {
+            # Удаляем старое сообщение в группе (если возможно)
+            'group': context.bot.delete_message(
                 chat_id=Config.ADMIN_GROUP_CHAT_ID,
                 message_id=app_data['message_id']
-            )
-        except Exception as e:
-            print(f"DEBUG: Не удалось удалить старое сообщение: {e}")
-        
-        # Получаем обновленные данные заявки
-        application = db.get_application(app_id)
-        
-        # Отправляем новое сообщение в группу с причиной возврата
-        # Отправляем новое сообщение в группу с причиной возврата
-        keyboard = get_application_keyboard(app_id)
-        message_text = (
-            f"🔄 Заявка #{app_id} ВОЗВРАЩЕНА\n\n"
-            f"Адрес: {application['address']}\n"
-            f"Задача: {application['task']}\n"
-        )
-        
-        # Добавляем комментарий, если он есть
-        if application['comment'] and application['comment'].strip():
-            message_text += f"Комментарий: {application['comment']}\n"
-        
-        # Добавляем информацию о возврате
-        message_text += f"От: @{application['username']}\n"
-        message_text += f"Причина возврата: {reason}\n"
-        message_text += f"Вернул: @{update.effective_user.username or update.effective_user.full_name}"
-        
-        sent_message = await context.bot.send_message(
-            chat_id=Config.ADMIN_GROUP_CHAT_ID,
-            text=message_text,
-            reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Обновляем message_id в базе данных
-        db.set_message_id(app_id, sent_message.message_id)
-        
+            ),
+            # Подтверждение пользователю
+            'executor': update.message.reply_text(
+                f"✅ Заявка #{app_id} успешно возвращена в общий чат.\n"
+                f"Причина: {reason}"
+            ),
+            'prompt': delete_private_prompt(),
+        }
         # Уведомляем создателя заявки
         if user_id != application['user_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=application['user_id'],
-                    text=f"⚠️ Ваша заявка #{app_id} возвращена в общий чат.\n"
-                         f"Причина: {reason}\n"
-                         f"Заявка будет доступна другим исполнителям."
-                )
-            except Exception as e:
-                print(f"DEBUG: Не удалось уведомить создателя: {e}")
-        
-        # Подтверждение пользователю
-        await update.message.reply_text(
-            f"✅ Заявка #{app_id} успешно возвращена в общий чат.\n"
-            f"Причина: {reason}"
-        )
-        try:
-            # Удаляем сообщение с кнопками возврата
-            await context.bot.delete_message(
-                chat_id=user_id,
-                message_id=app_data.get('private_message_id', 0)
+            sends['creator'] = context.bot.send_message(
+                chat_id=application['user_id'],
+                text=f"⚠️ Ваша заявка #{app_id} возвращена в общий чат.\n"
+                     f"Причина: {reason}\n"
+                     f"Заявка будет доступна другим исполнителям."
             )
-        except Exception as e:
-            print(f"DEBUG: Не удалось удалить сообщение с кнопками: {e}")
+        await fan_out(f"Заявка #{app_id} возвращена", **sends)
 
     else:
-        await update.message.reply_text("❌ Ошибка при возврате заявки.")
+        await update.message.reply_text("❌ Вы не можете вернуть эту заявку.")
     
     # Очищаем состояние
     if user_id in return_states:
@@ -1131,11 +1022,7 @@ async def cancel_return_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     user_id = query.from_user.id
     
@@ -1144,31 +1031,32 @@ async def cancel_return_callback(update: Update, context: ContextTypes.DEFAULT_T
         del return_states[user_id]
     
     await query.edit_message_text("❌ Возврат заявки отменен.")
+    return ConversationHandler.END
+
+async def cancel_return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /cancel во время ввода причины возврата"""
+    return_states.pop(update.effective_user.id)
+    await update.message.reply_text("❌ Возврат заявки отменен.")
+    return ConversationHandler.END
 
 async def update_application_message_with_return_button(app_id, user_id, context):
     """Обновляет сообщение с заявкой, добавляя кнопку возврата"""
-    application = db.get_application(app_id)
+    application = await db.get_application(app_id)
     
     if not application or application['status'] != 'accepted':
         return
     
     # Проверяем, является ли пользователь исполнителем
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     if not is_accepted_by_user:
         return
     
     # Обновляем сообщение с кнопкой возврата
-    new_text = (
-        f"Заявка #{app_id} ПРИНЯТА\n\n"
-        f"Адрес: {application['address']}\n"
-        f"Задача: {application['task']}\n"
-        f"От: @{application['username']}\n"
-        f"Принял: @{application['accepted_username']}"
-    )
+    new_text = render_card(application, CARD_ACCEPTED)
     
     keyboard = [
-        [InlineKeyboardButton("🔄 Вернуть заявку", callback_data=f'return_app_{app_id}')],
-#        [InlineKeyboardButton("📞 Сохранить контакт", callback_data=f'save_contact_{app_id}')]
+        [InlineKeyboardButton("🔄 Вернуть заявку", callback_data=encode_callback(callbacks.RETURN, app_id))],
+#        [InlineKeyboardButton("📞 Сохранить контакт", callback_data=encode_callback(callbacks.SAVE_CONTACT, app_id))]
     ]
     
     # Пытаемся найти и обновить сообщение
@@ -1182,7 +1070,7 @@ async def update_application_message_with_return_button(app_id, user_id, context
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            print(f"DEBUG: Не удалось обновить сообщение: {e}")
+            logger.warning(f"Не удалось обновить сообщение: {e}", exc_info=True)
     
     # Также обновляем сообщение в личке пользователя, если оно есть
     try:
@@ -1190,8 +1078,8 @@ async def update_application_message_with_return_button(app_id, user_id, context
         async with context.bot:
             # Отправляем обновленное сообщение с кнопкой возврата
             return_keyboard = [[
-                InlineKeyboardButton("🔄 Вернуть заявку", callback_data=f'return_app_{app_id}'),
- #               InlineKeyboardButton("📞 Сохранить контакт", callback_data=f'save_contact_{app_id}')
+                InlineKeyboardButton("🔄 Вернуть заявку", callback_data=encode_callback(callbacks.RETURN, app_id)),
+ #               InlineKeyboardButton("📞 Сохранить контакт", callback_data=encode_callback(callbacks.SAVE_CONTACT, app_id))
             ]]
             
             full_info = (
@@ -1214,25 +1102,21 @@ async def update_application_message_with_return_button(app_id, user_id, context
                 reply_markup=InlineKeyboardMarkup(return_keyboard)
             )
     except Exception as e:
-        print(f"DEBUG: Не удалось отправить сообщение с кнопкой возврата: {e}")
+        logger.warning(f"Не удалось отправить сообщение с кнопкой возврата: {e}", exc_info=True)
 
-# Глобальные переменные для состояний закрытия заявки
-close_states = {}
+# Состояния закрытия заявки
+close_states = state_store.map('close')
 
 async def close_application_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопки 'Закрыть заявку'"""
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     # Проверяем, принял ли этот пользователь заявку
     user_id = query.from_user.id
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     
     if not is_accepted_by_user:
         await query.answer("❌ Только исполнитель, принявший заявку, может закрыть ее", show_alert=True)
@@ -1247,9 +1131,9 @@ async def close_application_callback(update: Update, context: ContextTypes.DEFAU
     
     # Создаем клавиатуру с вариантами закрытия
     keyboard = [
-        [InlineKeyboardButton("✅ Работа выполнена", callback_data=f'close_done_{app_id}')],
-        [InlineKeyboardButton("❌ Клиент отказался", callback_data=f'close_refused_{app_id}')],
-        [InlineKeyboardButton("❌ Отмена закрытия", callback_data=f'cancel_close_{app_id}')]
+        [InlineKeyboardButton("✅ Работа выполнена", callback_data=encode_callback(callbacks.CLOSE_DONE, app_id))],
+        [InlineKeyboardButton("❌ Клиент отказался", callback_data=encode_callback(callbacks.CLOSE_REFUSED, app_id))],
+        [InlineKeyboardButton("❌ Отмена закрытия", callback_data=encode_callback(callbacks.CANCEL_CLOSE, app_id))]
     ]
     
     # Отправляем запрос причины закрытия в личные сообщения
@@ -1261,27 +1145,25 @@ async def close_application_callback(update: Update, context: ContextTypes.DEFAU
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         # Сохраняем ID личного сообщения
-        close_states[user_id]['private_message_id'] = msg.message_id
+        close_states.update(user_id, private_message_id=msg.message_id)
         await query.answer("💬 Проверьте личные сообщения", show_alert=True)
     except Exception as e:
-        print(f"DEBUG: Не удалось отправить запрос в личку: {e}")
+        logger.warning(f"Не удалось отправить запрос в личку: {e}", exc_info=True)
         # Если не удалось в личку, спрашиваем в текущем чате
         await query.message.edit_text(
             text=f"🔒 Закрытие заявки #{app_id}\n\n"
                  f"Пожалуйста, выберите причину закрытия заявки:",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
+    
+    return Config.CLOSE_REASON
 
 async def handle_close_done_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопки 'Работа выполнена'"""
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     # Закрываем заявку с причиной "Работа выполнена"
     success = await close_application_with_reason(app_id, query.from_user, "Работа выполнена", context)
@@ -1292,17 +1174,14 @@ async def handle_close_done_callback(update: Update, context: ContextTypes.DEFAU
     else:
         # Оставляем на текущем экране
         await query.answer("❌ Не удалось закрыть заявку", show_alert=True)
+    return ConversationHandler.END
 
 async def handle_close_refused_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопки 'Клиент отказался'"""
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[2])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     # Закрываем заявку с причиной "Клиент отказался"
     success = await close_application_with_reason(app_id, query.from_user, "Клиент отказался", context)
@@ -1313,53 +1192,65 @@ async def handle_close_refused_callback(update: Update, context: ContextTypes.DE
     else:
         # Оставляем на текущем экране
         await query.answer("❌ Не удалось закрыть заявку", show_alert=True)
+    return ConversationHandler.END
+
+async def remove_group_card(application, context):
+    """Удаляет карточку закрытой заявки из группы.
+
+    Сообщения старше 48 часов бот удалить не может - тогда карточка
+    заменяется текстом закрытой заявки.
+    """
+    try:
+        await context.bot.delete_message(
+            chat_id=Config.ADMIN_GROUP_CHAT_ID,
+            message_id=application['message_id']
+        )
+    except BadRequest as e:
+        logger.warning(f"Не удалось удалить карточку заявки #{application['id']}: {e}")
+        if application.get('photo_file_id'):
+            await context.bot.edit_message_caption(
+                chat_id=Config.ADMIN_GROUP_CHAT_ID,
+                message_id=application['message_id'],
+                caption=render_card(application, CARD_CLOSED, caption=True),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        else:
+            await context.bot.edit_message_text(
+                chat_id=Config.ADMIN_GROUP_CHAT_ID,
+                message_id=application['message_id'],
+                text=render_card(application, CARD_CLOSED),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        return "карточка помечена закрытой"
 
 async def close_application_with_reason(app_id, user, reason, context):
     """Закрытие заявки с указанной причиной, возвращает True при успехе"""
     user_id = user.id
     username = user.username or user.full_name
     
-    # Проверяем, имеет ли пользователь право закрыть заявку
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
-    if not is_accepted_by_user:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="❌ Вы не можете закрыть эту заявку."
-            )
-        except:
-            pass
-        return False
+    # Закрываем заявку; право на закрытие проверяется в том же запросе.
+    # Получаем обновленные данные заявки или None
+    application = await db.close_application(app_id, user_id, username, reason)
     
-    # Закрываем заявку в базе данных
-    success = db.close_application(app_id, user_id, username, reason)
-    
-    if success:
-        # Получаем обновленные данные заявки
-        application = db.get_application(app_id)
-        
+    if application:
+        sends = {}
         # УДАЛЯЕМ сообщение о заявке из группы
-        try:
-            if application.get('message_id'):
-                await context.bot.delete_message(
-                    chat_id=Config.ADMIN_GROUP_CHAT_ID,
-                    message_id=application['message_id']
-                )
-        except Exception as e:
-            print(f"DEBUG: Не удалось удалить сообщение из группы: {e}")
+        if application.get('message_id'):
+            sends['group'] = remove_group_card(application, context)
         
         # Уведомляем создателя заявки
         if user_id != application['user_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=application['user_id'],
-                    text=f"🔒 Ваша заявка #{app_id} закрыта!\n\n"
-                         f"Исполнитель: @{application['accepted_username']}\n"
-                         f"Причина: {reason}\n\n"
-                         f"Спасибо за использование нашего сервиса!"
-                )
-            except Exception as e:
-                print(f"DEBUG: Не удалось уведомить создателя: {e}")
+            sends['creator'] = context.bot.send_message(
+                chat_id=application['user_id'],
+                text=f"🔒 Ваша заявка #{app_id} закрыта!\n\n"
+                     f"Исполнитель: @{application['accepted_username']}\n"
+                     f"Причина: {reason}\n\n"
+                     f"Спасибо за использование нашего сервиса!"
+            )
+        
+        # Отправки независимы и идут параллельно
+        if sends:
+            await fan_out(f"Заявка #{app_id} закрыта", **sends)
         
         # Очищаем состояние
         if user_id in close_states:
@@ -1367,6 +1258,13 @@ async def close_application_with_reason(app_id, user, reason, context):
         
         return True
     else:
+        try:
+            await context.bot.send_message(
+                chat_id=user_id,
+                text="❌ Вы не можете закрыть эту заявку."
+            )
+        except:
+            pass
         return False
 
 async def cancel_close_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1374,36 +1272,50 @@ async def cancel_close_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
+    user_id = query.from_user.id
+    # Очищаем состояние закрытия
+    if user_id in close_states:
+        del close_states[user_id]
+    
+    # Возвращаемся к списку заявок
+    await show_my_accepted_applications(update, context)
+    return ConversationHandler.END
+
+def _parse_page_callback(query, action):
+    """Разбирает callback_data навигации по страницам (действие action).
+
+    Возвращает (cursor, backward); для остальных callback - первая страница.
+    """
+    if query is None:
+        return None, False
+    callback = parse_callback(query)
+    if callback.action != action:
+        return None, False
+    direction, cursor = callback.args
     try:
-        # Пытаемся получить app_id из callback_data
-        parts = query.data.split('_')
-        if len(parts) >= 3:
-            app_id = int(parts[2])
-            
-            user_id = query.from_user.id
-            # Очищаем состояние закрытия
-            if user_id in close_states:
-                del close_states[user_id]
-            
-            # Возвращаемся к списку заявок
-            await show_my_accepted_applications(update, context)
-        else:
-            # Если нет app_id, просто показываем меню
-            from keyboards import get_private_chat_keyboard
-            await query.edit_message_text(
-                text="❌ Закрытие заявки отменено.",
-                reply_markup=get_private_chat_keyboard()
-            )
-    except (IndexError, ValueError):
-        # Если ошибка, просто показываем меню
-        from keyboards import get_private_chat_keyboard
-        await query.edit_message_text(
-            text="❌ Закрытие заявки отменено.",
-            reply_markup=get_private_chat_keyboard()
-        )
+        return decode_cursor(cursor), direction == 'prev'
+    except ValueError:
+        return None, False
+
+def _page_cursors(rows, cursor, backward, has_more):
+    """Курсоры для кнопок ◀️/▶️ текущей страницы"""
+    if not rows:
+        return None, None
+    if cursor is None:
+        # Первая страница
+        has_prev, has_next = False, has_more
+    elif backward:
+        # Пришли со следующей страницы
+        has_prev, has_next = has_more, True
+    else:
+        # Пришли с предыдущей страницы
+        has_prev, has_next = True, has_more
+    prev_cursor = encode_cursor(rows[0]) if has_prev else None
+    next_cursor = encode_cursor(rows[-1]) if has_next else None
+    return prev_cursor, next_cursor
 
 async def show_my_accepted_applications(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать заявки, принятые пользователем"""
+    """Показать заявки, принятые пользователем (постранично)"""
     query = update.callback_query
     if query:
         await query.answer()
@@ -1413,8 +1325,17 @@ async def show_my_accepted_applications(update: Update, context: ContextTypes.DE
         user_id = update.effective_user.id
         message = update.message
     
-    # Получаем принятые пользователем заявки
-    applications = db.get_user_accepted_applications(user_id)
+    cursor, backward = _parse_page_callback(query, callbacks.ACCEPTED_PAGE)
+    
+    # Получаем страницу принятых пользователем заявок
+    applications, has_more = await db.get_user_accepted_applications(
+        user_id, cursor=cursor, backward=backward
+    )
+    
+    if not applications and cursor is not None:
+        # Страница опустела (заявки закрыли) - показываем первую
+        cursor, backward = None, False
+        applications, has_more = await db.get_user_accepted_applications(user_id)
     
     if not applications:
         text = "📋 У вас нет принятых заявок."
@@ -1426,14 +1347,15 @@ async def show_my_accepted_applications(update: Update, context: ContextTypes.DE
             await message.reply_text(text=text, reply_markup=keyboard)
         return
     
-    text = f"📋 Ваши принятые заявки ({len(applications)}):\n\n"
+    total = await db.count_user_accepted_applications(user_id)
+    text = f"📋 Ваши принятые заявки ({total}):\n\n"
     
     # Создаем клавиатуру с кнопками "Закрыть" для каждой заявки
     keyboard = []
     
-    for i, app in enumerate(applications, 1):
+    for app in applications:
         # Формируем текст для заявки
-        text += f"{i}. Заявка #{app['id']}\n"
+        text += f"• Заявка #{app['id']}\n"
         text += f"   📍 Адрес: {app['address'][:50]}" + ("..." if len(app['address']) > 50 else "") + "\n"
         text += f"   📝 Задача: {app['task'][:50]}" + ("..." if len(app['task']) > 50 else "") + "\n"
         text += f"   🕐 Создана: {app['created_at'].strftime('%d.%m.%Y %H:%M')}\n"
@@ -1442,15 +1364,20 @@ async def show_my_accepted_applications(update: Update, context: ContextTypes.DE
         keyboard.append([
             InlineKeyboardButton(
                 f"🔒 Закрыть #{app['id']}", 
-                callback_data=f'close_from_list_{app["id"]}'
+                callback_data=encode_callback(callbacks.CLOSE_FROM_LIST, app['id'])
             )
         ])
         
         text += "\n"  # Отступ между заявками
     
+    # Кнопки навигации по страницам
+    navigation = get_pagination_row(callbacks.ACCEPTED_PAGE, *_page_cursors(applications, cursor, backward, has_more))
+    if navigation:
+        keyboard.append(navigation)
+    
     # Добавляем кнопку возврата в меню
     keyboard.append([
-        InlineKeyboardButton("🔙 Назад в меню", callback_data='back_to_menu')
+        InlineKeyboardButton("🔙 Назад в меню", callback_data=encode_callback(callbacks.MENU))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1473,15 +1400,11 @@ async def handle_close_from_list_callback(update: Update, context: ContextTypes.
     query = update.callback_query
     await query.answer()
     
-    try:
-        app_id = int(query.data.split('_')[3])
-    except (IndexError, ValueError):
-        await query.answer("❌ Ошибка: неверный ID заявки", show_alert=True)
-        return
+    app_id = parse_callback(query).args[0]
     
     # Проверяем, принял ли этот пользователь заявку
     user_id = query.from_user.id
-    is_accepted_by_user = db.check_application_owner(app_id, user_id)
+    is_accepted_by_user = await db.check_application_owner(app_id, user_id)
     
     if not is_accepted_by_user:
         await query.answer("❌ Только исполнитель, принявший заявку, может закрыть ее", show_alert=True)
@@ -1496,13 +1419,13 @@ async def handle_close_from_list_callback(update: Update, context: ContextTypes.
     
     # Создаем клавиатуру с вариантами закрытия
     keyboard = [
-        [InlineKeyboardButton("✅ Работа выполнена", callback_data=f'close_done_{app_id}')],
-        [InlineKeyboardButton("❌ Клиент отказался", callback_data=f'close_refused_{app_id}')],
-        [InlineKeyboardButton("🔙 Назад к списку", callback_data='my_accepted_apps')]
+        [InlineKeyboardButton("✅ Работа выполнена", callback_data=encode_callback(callbacks.CLOSE_DONE, app_id))],
+        [InlineKeyboardButton("❌ Клиент отказался", callback_data=encode_callback(callbacks.CLOSE_REFUSED, app_id))],
+        [InlineKeyboardButton("🔙 Назад к списку", callback_data=encode_callback(callbacks.MY_ACCEPTED))]
     ]
     
     # Получаем данные заявки для информации
-    application = db.get_application(app_id)
+    application = await db.get_application(app_id)
     
     info_text = ""
     if application:
@@ -1516,9 +1439,10 @@ async def handle_close_from_list_callback(update: Update, context: ContextTypes.
         text=info_text + "Пожалуйста, выберите причину закрытия заявки:",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    return Config.CLOSE_REASON
 
 async def show_my_created_applications(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать заявки, созданные пользователем"""
+    """Показать заявки, созданные пользователем (постранично)"""
     query = update.callback_query
     if query:
         await query.answer()
@@ -1528,8 +1452,17 @@ async def show_my_created_applications(update: Update, context: ContextTypes.DEF
         user_id = update.effective_user.id
         message = update.message
     
-    # Получаем созданные пользователем заявки
-    applications = db.get_user_created_applications(user_id)
+    cursor, backward = _parse_page_callback(query, callbacks.CREATED_PAGE)
+    
+    # Получаем страницу созданных пользователем заявок
+    applications, has_more = await db.get_user_created_applications(
+        user_id, cursor=cursor, backward=backward
+    )
+    
+    if not applications and cursor is not None:
+        # Страница опустела - показываем первую
+        cursor, backward = None, False
+        applications, has_more = await db.get_user_created_applications(user_id)
     
     if not applications:
         text = "📨 У вас нет активных отправленных заявок."
@@ -1541,24 +1474,28 @@ async def show_my_created_applications(update: Update, context: ContextTypes.DEF
             await message.reply_text(text=text, reply_markup=keyboard)
         return
     
-    pending_count = len([a for a in applications if a['status'] == 'pending'])
-    accepted_count = len([a for a in applications if a['status'] == 'accepted'])
+    counts = await db.count_user_created_applications(user_id)
+    pending_count = counts['pending']
+    accepted_count = counts['accepted']
     
-    text = f"📨 Ваши отправленные заявки ({len(applications)}):\n"
+    text = f"📨 Ваши отправленные заявки ({pending_count + accepted_count}):\n"
     text += f"⏳ Ожидают: {pending_count}\n"
     text += f"✅ Приняты: {accepted_count}\n\n"
     
-    for i, app in enumerate(applications, 1):
+    for app in applications:
         status_emoji = '⏳' if app['status'] == 'pending' else '✅'
         accepted_by = f" (@{app['accepted_username']})" if app['accepted_username'] else ""
         
-        text += f"{i}. {status_emoji} Заявка #{app['id']}\n"
+        text += f"{status_emoji} Заявка #{app['id']}\n"
         text += f"   Адрес: {app['address'][:50]}...\n"
         text += f"   Задача: {app['task'][:50]}...\n"
         text += f"   Статус: {Application.get_status_text(app['status'])}{accepted_by}\n"
         text += f"   Создана: {app['created_at'].strftime('%d.%m.%Y %H:%M')}\n\n"
     
     keyboard = get_private_chat_keyboard()
+    navigation = get_pagination_row(callbacks.CREATED_PAGE, *_page_cursors(applications, cursor, backward, has_more))
+    if navigation:
+        keyboard = InlineKeyboardMarkup([navigation, *keyboard.inline_keyboard])
     
     if query:
         await query.edit_message_text(text=text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
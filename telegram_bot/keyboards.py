@@ -1,19 +1,21 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+import callbacks
+from callbacks import encode as encode_callback
 
 def get_main_keyboard():
     """Клавиатура для группового чата"""
     keyboard = [
-        [InlineKeyboardButton("ℹ️ Помощь", callback_data='show_help')]
+        [InlineKeyboardButton("ℹ️ Помощь", callback_data=encode_callback(callbacks.HELP))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 def get_private_chat_keyboard():
     """Основная клавиатура для личного чата"""
     keyboard = [
-        [InlineKeyboardButton("📝 Создать заявку", callback_data='create_application')],
-        [InlineKeyboardButton("📋 Взятые заявки", callback_data='my_accepted_apps')],
-        [InlineKeyboardButton("📨 Отправленные заявки", callback_data='my_created_apps')],
-        [InlineKeyboardButton("ℹ️ Помощь", callback_data='show_help')]
+        [InlineKeyboardButton("📝 Создать заявку", callback_data=encode_callback(callbacks.CREATE))],
+        [InlineKeyboardButton("📋 Взятые заявки", callback_data=encode_callback(callbacks.MY_ACCEPTED))],
+        [InlineKeyboardButton("📨 Отправленные заявки", callback_data=encode_callback(callbacks.MY_CREATED))],
+        [InlineKeyboardButton("ℹ️ Помощь", callback_data=encode_callback(callbacks.HELP))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -30,7 +32,7 @@ def get_photo_choice_keyboard():
 def get_application_keyboard(application_id):
     """Клавиатура для принятия заявки"""
     keyboard = [[
-        InlineKeyboardButton("✅ Принять заявку", callback_data=f'accept_{application_id}')
+        InlineKeyboardButton("✅ Принять заявку", callback_data=encode_callback(callbacks.ACCEPT, application_id))
     ]]
     return InlineKeyboardMarkup(keyboard)
 
@@ -38,12 +40,21 @@ def get_application_management_keyboard(app_id):
     """Клавиатура для управления принятой заявкой"""
     keyboard = [
         [
-            InlineKeyboardButton("🔄 Вернуть заявку", callback_data=f'return_app_{app_id}'),
-            InlineKeyboardButton("🔒 Закрыть заявку", callback_data=f'close_app_{app_id}')
+            InlineKeyboardButton("🔄 Вернуть заявку", callback_data=encode_callback(callbacks.RETURN, app_id)),
+            InlineKeyboardButton("🔒 Закрыть заявку", callback_data=encode_callback(callbacks.CLOSE, app_id))
         ],
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def get_pagination_row(action, prev_cursor=None, next_cursor=None):
+    """Кнопки навигации по страницам списка (пустой список, если листать некуда)"""
+    row = []
+    if prev_cursor:
+        row.append(InlineKeyboardButton("◀️", callback_data=encode_callback(action, 'prev', prev_cursor)))
+    if next_cursor:
+        row.append(InlineKeyboardButton("▶️", callback_data=encode_callback(action, 'next', next_cursor)))
+    return row
+
 def remove_keyboard():
     """Удаление клавиатуры"""
     from telegram import ReplyKeyboardRemove
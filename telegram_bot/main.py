@@ -1,10 +1,24 @@
 import logging
 from telegram import Update, BotCommand, BotCommandScopeAllPrivateChats, BotCommandScopeAllGroupChats
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ConversationHandler
 from config import Config
 import handlers
 from database import db
-import threading
+from dispatcher import OutboundDispatcher
+from outbox import OutboxRelay
+from ratelimit import rate_limiter
+from catchup import catch_up, run_heartbeat
+from update_processor import PerUserUpdateProcessor
+from state_store import state_store
+from persistence import ConversationPersistence
+import callbacks
+from callbacks import ActionHandler, CallbackRouter
+import asyncio
+import sys
+import warnings
+from telegram.warnings import PTBUserWarning
+import uvicorn
+import webhook
 from webhook import run_webhook_server
 
 
@@ -15,11 +29,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Состояния для возврата заявки
-RETURN_REASON = 100
+# Диалоги намеренно не привязаны к сообщениям (per_message=False):
+# кнопки заявки в группе и текст в личке относятся к одному диалогу
+warnings.filterwarnings('ignore', message=r".*'CallbackQueryHandler'", category=PTBUserWarning)
+
+async def open_storage():
+    """Подключение к БД и загрузка незавершенных диалогов.
+
+    Вызывается из ConversationPersistence при Application.initialize (до
+    post_init), повторные вызовы ничего не делают.
+    """
+    # Пул соединений открывается в event loop бота
+    if not db.is_connected:
+        try:
+            await db.connect()
+            logger.info("✓ База данных подключена")
+        except Exception as e:
+            logger.error(f"✗ Ошибка подключения к базе данных: {e}")
+            raise
+    
+    # Незавершенные диалоги, сохраненные до перезапуска
+    await state_store.start(db)
 
 async def post_init(application: Application):
-    """Установка команд меню после инициализации бота"""
+    """Запуск outbox relay и установка команд меню после инициализации бота"""
+    await open_storage()
+    
+    # Отправка карточек заявок из outbox через бота приложения
+    dispatcher = OutboundDispatcher(bot=application.bot)
+    relay = OutboxRelay(db, dispatcher)
+    await dispatcher.start()
+    await relay.start()
+    application.bot_data['outbox_relay'] = relay
+    application.bot_data['outbox_dispatcher'] = dispatcher
+    logger.info("✓ Outbox relay запущен")
+    
     try:
         # Команды только для личных чатов
         private_commands = [
@@ -46,26 +90,53 @@ async def post_init(application: Application):
         
     except Exception as e:
         logger.error(f"✗ Ошибка установки меню: {e}")
-
-def run_bot():
-    """Запуск бота"""
-    if db is None or db.conn is None:
-        logger.error("✗ База данных не инициализирована.")
-        return
     
+    # Нажатия кнопок, сделанные пока бот перезапускался, не теряем
+    if Config.UPDATE_MODE == 'polling' and Config.CATCHUP_ENABLED:
+        try:
+            await catch_up(application)
+        except Exception as e:
+            logger.error(f"✗ Ошибка обработки накопившихся обновлений: {e}")
+    
+    # Отметки работы бота - по ним catch_up оценивает давность нажатий
+    application.bot_data['heartbeat'] = asyncio.create_task(run_heartbeat(), name='heartbeat')
+
+async def post_stop(application: Application):
+    """Остановка outbox relay, пока бот еще может отправлять сообщения"""
+    heartbeat = application.bot_data.pop('heartbeat', None)
+    if heartbeat:
+        heartbeat.cancel()
+    relay = application.bot_data.get('outbox_relay')
+    if relay:
+        await relay.stop()
+        await application.bot_data['outbox_dispatcher'].stop()
+
+async def post_shutdown(application: Application):
+    """Сохранение состояний диалогов и закрытие пула соединений с БД"""
     try:
-        # Создаем приложение
-        application = (Application.builder()
-            .token(Config.BOT_TOKEN)
-            .pool_timeout(30)
-            .connect_timeout(30)
-            .read_timeout(30)
-            .write_timeout(30)
-            .post_init(post_init)
-            .build())
+        await state_store.stop()
     except Exception as e:
-        logger.error(f"✗ Ошибка: {e}")
-        return
+        logger.error(f"✗ Ошибка сохранения состояний диалогов: {e}")
+    await db.close()
+    logger.info("✓ Соединения с базой данных закрыты")
+
+def build_application():
+    """Создает приложение бота со всеми обработчиками"""
+    application = (Application.builder()
+        .token(Config.BOT_TOKEN)
+        .pool_timeout(30)
+        .connect_timeout(30)
+        .read_timeout(30)
+        .write_timeout(30)
+        .rate_limiter(rate_limiter)  # общий с HTTP-сервером
+        # Разные пользователи обрабатываются параллельно, один - по порядку
+        .concurrent_updates(PerUserUpdateProcessor(Config.UPDATE_CONCURRENCY))
+        # Текущие шаги диалогов переживают перезапуск (через state_store)
+        .persistence(ConversationPersistence(state_store, load=open_storage))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build())
     
     # Создаем фильтр для отмены
     cancel_filter = filters.Regex(r'^(❌ Отмена|отмена|cancel|Отмена)$')
@@ -76,7 +147,7 @@ def run_bot():
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("new", handlers.new_application),
-            CallbackQueryHandler(handlers.create_application_callback, pattern='^create_application$')
+            ActionHandler(callbacks.CREATE, handlers.create_application_callback)
         ],
         states={
             Config.ADDRESS: [
@@ -105,105 +176,97 @@ def run_bot():
                                    reply_markup=handlers.get_photo_choice_keyboard()
                                ))
             ],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, handlers.conversation_timeout(handlers.user_states))
+            ],
         },
         fallbacks=[
             CommandHandler("cancel", handlers.handle_cancel_button),
             MessageHandler(cancel_filter, handlers.handle_cancel_button)
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        conversation_timeout=Config.CONVERSATION_TIMEOUT,
+        name='create',
+        persistent=True
     )
     
-    # Создаем обработчик для возврата заявки (без ConversationHandler, так как это один шаг)
-    # Добавляем ConversationHandler
-    application.add_handler(conv_handler)
-    
-    # Обработчик кнопки "Принять заявку"
-    application.add_handler(CallbackQueryHandler(
-        handlers.accept_application_callback, 
-        pattern='^accept_'
-    ))
-    
-    # Обработчик кнопки "Вернуть заявку"
-    application.add_handler(CallbackQueryHandler(
-        handlers.return_application_callback, 
-        pattern='^return_app_'
-    ))
-    
-    # Обработчик кнопки "Отмена возврата"
-    application.add_handler(CallbackQueryHandler(
-        handlers.cancel_return_callback, 
-        pattern='^cancel_return_'
-    ))
-    
-    # Обработчик для ввода причины возврата (обрабатывает текст после нажатия кнопки возврата)
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
-        handlers.handle_return_reason
-    ))
-    
-    # Обработчик кнопки "Сохранить контакт"
-    application.add_handler(CallbackQueryHandler(
-        handlers.save_contact_callback, 
-        pattern='^save_contact_'
-    ))
-    
-    # Обработчик кнопок копирования данных
-    application.add_handler(CallbackQueryHandler(
-        handlers.copy_data_callback, 
-        pattern='^copy_'
-    ))
-
-    # Обработчик кнопки "Закрыть заявку"
-    application.add_handler(CallbackQueryHandler(
-        handlers.close_application_callback, 
-        pattern='^close_app_'
-    ))
-    
-    # Обработчик кнопки "Работа выполнена"
-    application.add_handler(CallbackQueryHandler(
-        handlers.handle_close_done_callback, 
-        pattern='^close_done_'
-    ))
-    
-    # Обработчик кнопки "Клиент отказался"
-    application.add_handler(CallbackQueryHandler(
-        handlers.handle_close_refused_callback, 
-        pattern='^close_refused_'
-    ))
-    
-    # Обработчик кнопки "Отмена закрытия"
-    application.add_handler(CallbackQueryHandler(
-        handlers.cancel_close_callback, 
-        pattern='^cancel_close_'
-    ))    
-
-    # Обработчики для новых опций меню
-    application.add_handler(CallbackQueryHandler(
-        handlers.show_my_accepted_applications,
-        pattern='^my_accepted_apps$'
-    ))
-    
-    application.add_handler(CallbackQueryHandler(
-        handlers.show_my_created_applications,
-        pattern='^my_created_apps$'
-    ))
+    # Возврат заявки: нажатие кнопки в группе, причина - текстом в личке.
+    # Диалог привязан к пользователю (per_chat=False), поэтому текст
+    # обрабатывается как причина только после нажатия "Вернуть заявку".
+    # Зарегистрирован после создания заявки: пока пользователь заполняет
+    # заявку, его текст достается диалогу создания.
+    return_handler = ConversationHandler(
+        entry_points=[
+            ActionHandler(callbacks.RETURN, handlers.return_application_callback),
+            # Кнопка отмены работает и после завершения диалога
+            ActionHandler(callbacks.CANCEL_RETURN, handlers.cancel_return_callback)
+        ],
+        states={
+            Config.RETURN_REASON: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
+                               handlers.handle_return_reason),
+                ActionHandler(callbacks.CANCEL_RETURN, handlers.cancel_return_callback)
+            ],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, handlers.conversation_timeout(handlers.return_states))
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", handlers.cancel_return_command)],
+        per_chat=False,
+        allow_reentry=True,
+        conversation_timeout=Config.CONVERSATION_TIMEOUT,
+        name='return',
+        persistent=True
+    )
     
-    application.add_handler(CallbackQueryHandler(
-        handlers.show_help_callback,
-        pattern='^show_help$'
-    ))
+    # Закрытие заявки: выбор причины кнопкой (из группы или из списка заявок)
+    close_handler = ConversationHandler(
+        entry_points=[
+            ActionHandler(callbacks.CLOSE, handlers.close_application_callback),
+            ActionHandler(callbacks.CLOSE_FROM_LIST, handlers.handle_close_from_list_callback),
+            # Кнопки причин работают и после завершения диалога
+            ActionHandler(callbacks.CLOSE_DONE, handlers.handle_close_done_callback),
+            ActionHandler(callbacks.CLOSE_REFUSED, handlers.handle_close_refused_callback),
+            ActionHandler(callbacks.CANCEL_CLOSE, handlers.cancel_close_callback)
+        ],
+        states={
+            Config.CLOSE_REASON: [
+                ActionHandler(callbacks.CLOSE_DONE, handlers.handle_close_done_callback),
+                ActionHandler(callbacks.CLOSE_REFUSED, handlers.handle_close_refused_callback),
+                ActionHandler(callbacks.CANCEL_CLOSE, handlers.cancel_close_callback)
+            ],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, handlers.conversation_timeout(handlers.close_states))
+            ],
+        },
+        fallbacks=[],
+        per_chat=False,
+        allow_reentry=True,
+        conversation_timeout=Config.CONVERSATION_TIMEOUT,
+        name='close',
+        persistent=True
+    )
     
-    # Обработчик кнопки "Закрыть" из списка заявок
-    application.add_handler(CallbackQueryHandler(
-        handlers.handle_close_from_list_callback, 
-        pattern='^close_from_list_'
-    ))
+    # Добавляем ConversationHandler'ы
+    application.add_handler(conv_handler)
+    application.add_handler(return_handler)
+    application.add_handler(close_handler)
     
-    # Обработчик кнопки "Назад в меню"
-    application.add_handler(CallbackQueryHandler(
-        handlers.back_to_menu_callback, 
-        pattern='^back_to_menu$'
-    ))
+    # Остальные кнопки - один обработчик с поиском действия в словаре.
+    # Регистрируется после диалогов: их кнопки они забирают раньше, а
+    # устаревшие и поврежденные данные отклоняет router
+    router = CallbackRouter({
+        callbacks.ACCEPT: handlers.accept_application_callback,
+        callbacks.SAVE_CONTACT: handlers.save_contact_callback,
+        callbacks.COPY: handlers.copy_data_callback,
+        callbacks.MY_ACCEPTED: handlers.show_my_accepted_applications,
+        callbacks.ACCEPTED_PAGE: handlers.show_my_accepted_applications,
+        callbacks.MY_CREATED: handlers.show_my_created_applications,
+        callbacks.CREATED_PAGE: handlers.show_my_created_applications,
+        callbacks.HELP: handlers.show_help_callback,
+        callbacks.MENU: handlers.back_to_menu_callback,
+    })
+    application.add_handler(CallbackQueryHandler(router.dispatch))
 
     # Базовые команды
     application.add_handler(CommandHandler("start", handlers.start))
@@ -216,25 +279,87 @@ def run_bot():
     # Обработчик ошибок
     application.add_error_handler(handlers.error_handler)
     
+    return application
+
+def run_bot():
+    """Запуск только бота (раздельный режим)"""
+    application = build_application()
+    
     logger.info("✓ Бот запущен...")
     logger.info("✓ Готов к работе!")
     
     # Запускаем бота
     application.run_polling(
         allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True,
+        # Накопившиеся обновления уже обработаны в post_init (catch_up)
+        drop_pending_updates=not Config.CATCHUP_ENABLED,
         close_loop=False
     )
 
-def main():
-    """Запуск бота и HTTP-сервера параллельно"""
-    # Запускаем HTTP сервер в отдельном потоке
-    webhook_thread = threading.Thread(target=run_webhook_server, daemon=True)
-    webhook_thread.start()
-    logger.info("✓ HTTP-сервер для вебхуков запущен на порту 7000")
+async def run_all():
+    """Бот и HTTP-сервер в одном event loop.
+
+    HTTP-сервер использует бота, пул соединений с БД и диспетчер бота,
+    поэтому в процессе один Bot, один пул и один outbox relay.
+    """
+    application = build_application()
+    server = uvicorn.Server(uvicorn.Config(
+        webhook.app, host=Config.API_HOST, port=Config.API_PORT, log_config=None
+    ))
     
-    # Запускаем бота
-    run_bot()
+    # run_polling сам вызывает post_init/post_stop/post_shutdown,
+    # при ручном запуске делаем это явно
+    await application.initialize()
+    try:
+        await post_init(application)
+        webhook.share_resources(db, application.bot_data['outbox_dispatcher'], application)
+        if Config.UPDATE_MODE == 'webhook':
+            await application.start()
+            # Вебхук при остановке не удаляем: пока процесс перезапускается,
+            # Telegram копит обновления и доставит их после старта
+            await application.bot.set_webhook(
+                url=Config.TELEGRAM_WEBHOOK_URL,
+                secret_token=Config.TELEGRAM_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=False
+            )
+            logger.info(f"✓ Обновления Telegram принимаются вебхуком {Config.TELEGRAM_WEBHOOK_URL}")
+        else:
+            await application.updater.start_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=not Config.CATCHUP_ENABLED
+            )
+            await application.start()
+        logger.info(f"✓ Бот и HTTP-сервер запущены в одном event loop, порт {Config.API_PORT}")
+        
+        # serve() завершается по SIGINT/SIGTERM
+        await server.serve()
+    finally:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+            await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+def main():
+    """Запуск в выбранном режиме: all (по умолчанию), bot или api"""
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    if Config.UPDATE_MODE == 'webhook':
+        # Обновления принимает HTTP-сервер и кладет в очередь бота того же процесса
+        if mode != 'all':
+            sys.exit("UPDATE_MODE=webhook поддерживается только в режиме all")
+        if not (Config.TELEGRAM_WEBHOOK_URL and Config.TELEGRAM_WEBHOOK_SECRET):
+            sys.exit("Для UPDATE_MODE=webhook нужны TELEGRAM_WEBHOOK_URL и TELEGRAM_WEBHOOK_SECRET")
+    if mode == 'bot':
+        run_bot()
+    elif mode == 'api':
+        run_webhook_server(workers=Config.API_WORKERS)
+    elif mode == 'all':
+        asyncio.run(run_all())
+    else:
+        sys.exit(f"Неизвестный режим {mode!r}, ожидается all, bot или api")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
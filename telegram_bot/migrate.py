@@ -0,0 +1,176 @@
+"""Версионные миграции схемы БД.
+
+Миграции лежат в каталоге ``migrations/`` и называются ``NNNN_описание.sql``.
+Примененные версии записываются в таблицу ``schema_migrations``.
+
+Если первая строка файла ``-- migrate: no-transaction``, миграция выполняется
+вне транзакции по одному оператору (нужно для CREATE INDEX CONCURRENTLY).
+Такие файлы должны разделять операторы символом ``;`` и быть идемпотентными
+(IF NOT EXISTS), так как при сбое посередине они будут выполнены повторно.
+"""
+import asyncio
+import logging
+import re
+from pathlib import Path
+from typing import NamedTuple
+
+import psycopg
+from psycopg import errors
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+# Ключ advisory lock, чтобы несколько реплик не применяли миграции одновременно
+MIGRATION_LOCK_ID = 720_260_001
+# Пауза между попытками взять блокировку, секунд
+MIGRATION_LOCK_POLL_INTERVAL = 1.0
+
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
+_FILENAME_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    transactional: bool
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Читает файлы миграций, отсортированные по версии"""
+    migrations = []
+    for path in directory.iterdir():
+        match = _FILENAME_RE.match(path.name)
+        if not match:
+            continue
+        sql = path.read_text(encoding='utf-8')
+        migrations.append(Migration(
+            version=int(match.group(1)),
+            name=match.group(2),
+            sql=sql,
+            transactional=not sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+        ))
+    migrations.sort(key=lambda m: m.version)
+
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Повторяющиеся версии миграций: {versions}")
+    return migrations
+
+
+def _split_statements(sql):
+    """Разбивает скрипт на отдельные операторы, отбрасывая комментарии"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+async def is_up_to_date(pool, migrations):
+    """Быстрая проверка: одна выборка по первичному ключу schema_migrations"""
+    if not migrations:
+        return True
+    try:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = %s",
+                (migrations[-1].version,)
+            )
+            return await cursor.fetchone() is not None
+    except errors.UndefinedTable:
+        return False
+
+
+async def migrate(pool, conninfo=None, directory=MIGRATIONS_DIR):
+    """Применяет недостающие миграции, возвращает количество примененных.
+
+    Когда схема актуальна, стоит одного запроса к пулу. Иначе открывает
+    отдельное autocommit-соединение, берет advisory lock (см. _acquire_lock)
+    и применяет миграции.
+    """
+    migrations = load_migrations(directory)
+    if await is_up_to_date(pool, migrations):
+        return 0
+
+    applied = 0
+    async with await psycopg.AsyncConnection.connect(
+        conninfo or Config.DATABASE_URL, autocommit=True
+    ) as conn:
+        await _acquire_lock(conn)
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Пока ждали блокировку, миграции могла применить другая реплика
+            cursor = await conn.execute("SELECT version FROM schema_migrations")
+            done = {row[0] for row in await cursor.fetchall()}
+
+            for migration in migrations:
+                if migration.version in done:
+                    continue
+                logger.info(f"Применяем миграцию {migration.version:04d}_{migration.name}")
+                if migration.transactional:
+                    async with conn.transaction():
+                        await conn.execute(migration.sql)
+                        await _record(conn, migration)
+                else:
+                    await _drop_invalid_indexes(conn)
+                    for statement in _split_statements(migration.sql):
+                        await conn.execute(statement)
+                    await _record(conn, migration)
+                applied += 1
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+    logger.info(f"Применено миграций: {applied}")
+    return applied
+
+
+async def _acquire_lock(conn):
+    """Берет advisory lock миграций, опрашивая pg_try_advisory_lock.
+
+    Блокирующий pg_advisory_lock держит снимок, пока ждет, а CREATE INDEX
+    CONCURRENTLY на реплике, владеющей блокировкой, ждет завершения всех
+    снимков - взаимная блокировка. Короткие попытки со сном между ними
+    снимка не держат.
+    """
+    waiting = False
+    while True:
+        cursor = await conn.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        if (await cursor.fetchone())[0]:
+            return
+        if not waiting:
+            logger.info("Миграции применяет другая реплика, ждем")
+            waiting = True
+        await asyncio.sleep(MIGRATION_LOCK_POLL_INTERVAL)
+
+
+async def _record(conn, migration):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name)
+    )
+
+
+async def _drop_invalid_indexes(conn):
+    """Удаляет невалидные индексы, оставшиеся от прерванного CREATE INDEX CONCURRENTLY.
+
+    Иначе IF NOT EXISTS молча пропустил бы такой индекс при повторном запуске.
+    Вызывается под advisory lock, поэтому параллельных построений нет.
+    """
+    cursor = await conn.execute("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = current_schema()
+    """)
+    for (name,) in await cursor.fetchall():
+        logger.warning(f"Индекс {name} невалиден, пересоздаем")
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
@@ -0,0 +1,33 @@
+-- Таблица заявок. Колонки, добавленные после первого релиза, догоняются
+-- через ADD COLUMN IF NOT EXISTS для старых установок.
+CREATE TABLE IF NOT EXISTS applications (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    username VARCHAR(100),
+    address TEXT NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    task TEXT NOT NULL,
+    comment TEXT,
+    photo_file_id VARCHAR(200),
+    status VARCHAR(20) DEFAULT 'pending',
+    accepted_by BIGINT,
+    accepted_username VARCHAR(100),
+    return_reason TEXT,
+    returned_by BIGINT,
+    returned_username VARCHAR(100),
+    close_reason TEXT,
+    closed_by BIGINT,
+    closed_username VARCHAR(100),
+    closed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    message_id INTEGER
+);
+
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR(200);
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS return_reason TEXT;
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS returned_by BIGINT;
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS returned_username VARCHAR(100);
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS close_reason TEXT;
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS closed_by BIGINT;
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS closed_username VARCHAR(100);
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS closed_at TIMESTAMP;
@@ -0,0 +1,16 @@
+-- migrate: no-transaction
+-- Индексы под запросы бота. Строятся CONCURRENTLY, чтобы не блокировать
+-- запись в таблицу на существующих установках.
+-- Поиск по id (get_application, check_application_owner) обслуживает первичный ключ.
+
+-- get_pending_applications
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_pending
+    ON applications (created_at) WHERE status = 'pending';
+
+-- get_user_accepted_applications: accepted_by + ORDER BY created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_accepted_by
+    ON applications (accepted_by, created_at DESC) WHERE status = 'accepted';
+
+-- get_user_created_applications: user_id + ORDER BY created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_user_active
+    ON applications (user_id, created_at DESC) WHERE status IN ('pending', 'accepted');
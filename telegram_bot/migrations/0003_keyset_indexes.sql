@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Индексы списков заявок дополнены id для keyset-пагинации по (created_at, id)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_accepted_by_page
+    ON applications (accepted_by, created_at DESC, id DESC) WHERE status = 'accepted';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_user_active_page
+    ON applications (user_id, created_at DESC, id DESC) WHERE status IN ('pending', 'accepted');
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_applications_accepted_by;
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_applications_user_active;
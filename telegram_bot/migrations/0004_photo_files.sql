@@ -0,0 +1,7 @@
+-- file_id фото, загруженных с сайта, по sha256 содержимого,
+-- чтобы повторно присланное фото не загружать в Telegram еще раз
+CREATE TABLE IF NOT EXISTS photo_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    file_id VARCHAR(200) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,2 @@
+-- Ключ идемпотентности заявок с сайта (sha256 от Idempotency-Key или содержимого)
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS idempotency_key CHAR(64);
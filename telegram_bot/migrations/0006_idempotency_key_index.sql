@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Уникальность ключа идемпотентности; заявки из бота ключа не имеют
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_applications_idempotency_key
+    ON applications (idempotency_key) WHERE idempotency_key IS NOT NULL;
@@ -0,0 +1,19 @@
+-- Исходящие сообщения в Telegram (transactional outbox).
+-- Запись добавляется в той же транзакции, что и изменение заявки,
+-- и удаляется из очереди (sent_at) только после успешной отправки
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    application_id INTEGER REFERENCES applications(id),
+    payload JSONB NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP,
+    failed_at TIMESTAMP
+);
+
+-- Очередь к отправке: только неотправленные записи
+CREATE INDEX IF NOT EXISTS idx_outbox_due
+    ON outbox (next_attempt_at) WHERE sent_at IS NULL AND failed_at IS NULL;
@@ -0,0 +1,12 @@
+-- Состояния диалогов бота (создание/возврат/закрытие заявки),
+-- чтобы перезапуск не терял незавершенные диалоги
+CREATE TABLE IF NOT EXISTS bot_state (
+    namespace VARCHAR(50) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (namespace, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_bot_state_expires_at ON bot_state (expires_at);
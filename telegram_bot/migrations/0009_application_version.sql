@@ -0,0 +1,3 @@
+-- Версия строки заявки: растет при каждом изменении статуса,
+-- по (id, version) кэшируется текст карточки (см. cards.py)
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
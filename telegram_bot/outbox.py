@@ -0,0 +1,172 @@
+"""Надежная отправка карточек заявок в группу через таблицу outbox.
+
+Запись в outbox делается в той же транзакции, что и изменение заявки
+(см. Database), поэтому карточка не теряется, если Telegram недоступен
+или процесс перезапустился. OutboxRelay забирает готовые к отправке записи
+и отправляет их через OutboundDispatcher с экспоненциальной задержкой
+повторов и учетом RetryAfter. Карточки в группу идут с низким приоритетом
+общего ограничителя запросов (ratelimit).
+"""
+import asyncio
+import logging
+
+from telegram import InputMediaPhoto
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter
+
+from cards import CARD_NEW, CARD_RETURNED, render_card
+from config import Config
+from keyboards import get_application_keyboard
+
+logger = logging.getLogger(__name__)
+
+# Запущенные в процессе relay, чтобы notify() будил их сразу после записи
+_relays = set()
+
+
+def notify():
+    """Будит все relay процесса: в outbox появилась новая запись"""
+    for relay in list(_relays):
+        relay.notify()
+
+
+class OutboxRelay:
+    """Переносит записи outbox в очередь диспетчера и фиксирует результат"""
+
+    def __init__(self, db, dispatcher, poll_interval=None, batch_size=None):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.poll_interval = poll_interval or Config.OUTBOX_POLL_INTERVAL
+        self.batch_size = batch_size or Config.OUTBOX_BATCH_SIZE
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self._in_flight = 0  # взятые записи, отправка которых не завершена
+        self.sent = 0
+        self.failed = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name='outbox-relay')
+        _relays.add(self)
+        logger.info("Outbox relay запущен")
+
+    async def stop(self):
+        _relays.discard(self)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        """Потокобезопасно будит relay"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                # Не больше batch_size записей в работе: иначе хвост очереди
+                # ждал бы ограничителя дольше OUTBOX_LEASE и записи брались бы повторно
+                limit = min(self.batch_size - self._in_flight, self.dispatcher.free_slots())
+                rows = await self.db.claim_outbox(limit) if limit > 0 else []
+                for row in rows:
+                    self.dispatcher.submit(self._deliver, row)
+                    self._in_flight += 1
+                if rows and len(rows) == limit:
+                    continue  # возможно, есть еще готовые записи
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка чтения outbox: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver(self, bot, row):
+        """Задача диспетчера: отправка одной записи outbox"""
+        try:
+            await self._deliver_claimed(bot, row)
+        finally:
+            self._in_flight -= 1
+            # Освободилось место - можно взять следующие записи
+            self._wakeup.set()
+
+    async def _deliver_claimed(self, bot, row):
+        # Аренда отсчитывается заново от начала отправки; если запись тем
+        # временем взял другой relay, отправлять ее нельзя
+        if not await self.db.renew_outbox(row['id'], row['attempts']):
+            logger.warning(f"Outbox #{row['id']}: аренда истекла до отправки, запись пропущена")
+            return
+        try:
+            message_id = await self._send(bot, row)
+        except RetryAfter as e:
+            # Общую паузу уже выставил rate_limiter, запись откладываем на то же время
+            await self._retry(row, e.retry_after, e)
+            return
+        except Exception as e:
+            delay = min(Config.OUTBOX_BACKOFF_BASE * 2 ** (row['attempts'] - 1), Config.OUTBOX_BACKOFF_MAX)
+            await self._retry(row, delay, e)
+            return
+        await self.db.complete_outbox(row['id'], row['application_id'], message_id)
+        self.sent += 1
+
+    async def _retry(self, row, delay, error):
+        self.failed += 1
+        give_up = row['attempts'] >= Config.OUTBOX_MAX_ATTEMPTS
+        await self.db.fail_outbox(row['id'], delay, str(error), give_up=give_up)
+        if give_up:
+            logger.error(f"Outbox #{row['id']}: отправка не удалась после {row['attempts']} попыток: {error}")
+        else:
+            logger.warning(f"Outbox #{row['id']}: ошибка отправки ({error}), повтор через {delay} с")
+
+    async def _send(self, bot, row):
+        """Отправляет карточку заявки, возвращает message_id или None, если отправлять нечего"""
+        # Мимо кэша: в раздельном режиме его копия могла устареть, а заявку
+        # уже принял пользователь в другом процессе
+        application = await self.db.get_application(row['application_id'], cached=False)
+        if not application or application['status'] != 'pending':
+            # Заявку уже приняли или удалили - карточка неактуальна
+            return None
+
+        card = row['payload'].get('card', CARD_NEW)
+        keyboard = get_application_keyboard(application['id'])
+        photo_file_id = application['photo_file_id'] if card != CARD_RETURNED else None
+        text = render_card(application, card, caption=bool(photo_file_id), photo_attached=bool(photo_file_id))
+
+        if photo_file_id:
+            sent_message = await bot.send_photo(
+                chat_id=Config.ADMIN_GROUP_CHAT_ID,
+                photo=photo_file_id,
+                caption=text,
+                reply_markup=keyboard,
+                parse_mode=ParseMode.MARKDOWN
+            )
+        else:
+            sent_message = await bot.send_message(
+                chat_id=Config.ADMIN_GROUP_CHAT_ID,
+                text=text,
+                reply_markup=keyboard,
+                parse_mode=ParseMode.MARKDOWN
+            )
+
+        # Дополнительные фото - альбомом в ответ на карточку заявки
+        extra_photo_file_ids = row['payload'].get('extra_photo_file_ids')
+        if extra_photo_file_ids:
+            try:
+                await bot.send_media_group(
+                    chat_id=Config.ADMIN_GROUP_CHAT_ID,
+                    media=[InputMediaPhoto(file_id) for file_id in extra_photo_file_ids[:10]],
+                    reply_to_message_id=sent_message.message_id
+                )
+            except Exception as e:
+                logger.error(f"Не удалось отправить дополнительные фото заявки #{application['id']}: {e}")
+
+        logger.info(f"Заявка #{application['id']} отправлена в группу")
+        return sent_message.message_id
+
+    def stats(self):
+        return {'sent': self.sent, 'failed': self.failed}
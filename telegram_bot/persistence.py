@@ -0,0 +1,100 @@
+"""Сохранение состояний ConversationHandler в хранилище состояний диалогов.
+
+PTB держит текущее состояние каждого диалога (ожидание адреса, причины
+возврата и т.д.) в памяти; без persistence после перезапуска бот забывает,
+что пользователь был в середине диалога, и его сообщения больше не доходят
+до нужного обработчика. Здесь эти состояния пишутся в ``state_store`` (и через
+него в таблицу bot_state), а данные user_data/chat_data/bot_data не хранятся.
+"""
+import json
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import Config
+
+# PTB переносит изменения диалогов в persistence пачкой раз в update_interval.
+# Запись идет в память state_store, в БД ее переносит уже сам state_store.
+_UPDATE_INTERVAL = 1
+
+
+class ConversationPersistence(BasePersistence):
+    """Только состояния диалогов, по namespace 'conversation:<имя>' в StateStore.
+
+    ``load`` - корутина, подготавливающая хранилище: Application.initialize
+    читает диалоги раньше post_init, поэтому к первому чтению подключение к БД
+    и загрузку сохраненных состояний нужно выполнить здесь.
+    Состояние диалога живет в хранилище ``ttl`` секунд с последнего изменения.
+    """
+
+    def __init__(self, store, load=None, ttl=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=_UPDATE_INTERVAL
+        )
+        self.store = store
+        self.load = load
+        self.ttl = ttl or Config.CONVERSATION_TIMEOUT
+        self._maps = {}
+
+    def _map(self, name):
+        states = self._maps.get(name)
+        if states is None:
+            states = self._maps[name] = self.store.map(f'conversation:{name}', ttl=self.ttl)
+        return states
+
+    async def get_conversations(self, name):
+        if self.load is not None:
+            await self.load()
+        # Ключ диалога - кортеж id (чат/пользователь), в хранилище - JSON-строка
+        return {tuple(json.loads(key)): value['state'] for key, value in self._map(name).items()}
+
+    async def update_conversation(self, name, key, new_state):
+        states = self._map(name)
+        key = json.dumps(key)
+        if new_state is None:
+            states.pop(key)
+        else:
+            states[key] = {'state': new_state}
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        # Оставшиеся изменения сохраняет state_store.stop() в post_shutdown
+        pass
@@ -0,0 +1,263 @@
+"""Общий ограничитель запросов к Bot API для бота и HTTP-сервера.
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду в целом,
+20 сообщениями в минуту в одну группу и ~1 сообщением в секунду в личный
+чат. Все экземпляры бота процесса (бот PTB и Bot диспетчера HTTP-сервера)
+используют один ``rate_limiter``, поэтому лимиты соблюдаются суммарно.
+
+Ограничитель действует в пределах процесса. В раздельном режиме (bot + api)
+у процесса бота и у каждого воркера uvicorn свой ``rate_limiter``, и в
+группу исполнителей они вместе могут отправить больше 20 сообщений в минуту.
+Поэтому в режиме api карточки отправляет только бот (API_OUTBOX_RELAY=false),
+а фото с сайта нужно загружать в отдельный PHOTO_STORAGE_CHAT_ID.
+
+Запросы обслуживаются по приоритетам: ответы на нажатия кнопок и личные
+сообщения исполнителям идут раньше правок карточек, а те - раньше массовой
+отправки карточек в группу.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше
+PRIORITY_HIGH = 0    # answerCallbackQuery, личные чаты
+PRIORITY_NORMAL = 1  # правка/удаление сообщений в группе
+PRIORITY_LOW = 2     # новые сообщения в группу
+
+# Методы, на которые распространяются лимиты отправки сообщений
+_LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward', 'delete')
+
+# Допустимый всплеск сверх средней скорости
+_GROUP_BURST = 3
+_PRIVATE_BURST = 3
+
+# Сколько пустых корзин чатов держать в памяти
+_MAX_CHAT_BUCKETS = 10000
+
+
+class _TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def wait_time(self, now):
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """Корзины токенов (общая и по чатам) с приоритетами запросов.
+
+    Потокобезопасен: состояние под threading.Lock, ожидание - asyncio.sleep
+    в event loop вызывающего, поэтому один экземпляр можно отдать ботам,
+    работающим в разных потоках.
+
+    Приоритет определяется по методу и чату, его можно задать явно через
+    ``rate_limit_args={'priority': ...}`` при вызове метода бота.
+    У каждого чата и у общей корзины своя очередь ожидающих: токен получает
+    запрос с наивысшим приоритетом, при равном - пришедший раньше. Поэтому
+    правка карточки в группе не ждет накопившихся новых карточек, а сами
+    карточки уходят в порядке отправки.
+
+    При RetryAfter все запросы приостанавливаются на указанное время, а
+    запрос повторяется не более ``max_retries`` раз.
+    """
+
+    def __init__(self, global_rate=None, group_per_minute=None, private_rate=None, max_retries=None):
+        now = time.monotonic()
+        self.global_rate = global_rate or Config.RATE_LIMIT_GLOBAL_PER_SECOND
+        self.group_rate = (group_per_minute or Config.RATE_LIMIT_GROUP_PER_MINUTE) / 60
+        self.private_rate = private_rate or Config.RATE_LIMIT_PRIVATE_PER_SECOND
+        self.max_retries = Config.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self._lock = threading.Lock()
+        self._global = _TokenBucket(self.global_rate, self.global_rate, now)
+        self._chats = {}  # chat_id -> _TokenBucket
+        # Очереди ожидающих: куча билетов (приоритет, порядковый номер)
+        self._chat_queues = {}  # chat_id -> [билет]
+        self._global_queue = []
+        self._tickets = itertools.count()
+        self._paused_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.retry_after = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @staticmethod
+    def _is_group(chat_id):
+        # У групп и каналов отрицательный id, каналы можно указать как @username
+        if isinstance(chat_id, str):
+            return chat_id.startswith('@') or chat_id.startswith('-')
+        return chat_id < 0
+
+    def _priority(self, endpoint, chat_id, rate_limit_args):
+        if rate_limit_args and 'priority' in rate_limit_args:
+            return rate_limit_args['priority']
+        if endpoint == 'answerCallbackQuery' or chat_id is None:
+            return PRIORITY_HIGH
+        if not self._is_group(chat_id):
+            return PRIORITY_HIGH
+        if endpoint.startswith('send') or endpoint.startswith('copy') or endpoint.startswith('forward'):
+            return PRIORITY_LOW
+        return PRIORITY_NORMAL
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                # Полные корзины без очереди ничем не отличаются от новых
+                self._chats = {
+                    k: b for k, b in self._chats.items()
+                    if not b.is_full(now) or k in self._chat_queues
+                }
+            if self._is_group(chat_id):
+                bucket = _TokenBucket(self.group_rate, _GROUP_BURST, now)
+            else:
+                bucket = _TokenBucket(self.private_rate, _PRIVATE_BURST, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _enqueue(self, chat_id, priority):
+        """Ставит запрос в очередь чата (или сразу в общую). Возвращает (билет, этап)"""
+        with self._lock:
+            ticket = (priority, next(self._tickets))
+            if chat_id is None:
+                heapq.heappush(self._global_queue, ticket)
+                return ticket, 'global'
+            heapq.heappush(self._chat_queues.setdefault(chat_id, []), ticket)
+            return ticket, 'chat'
+
+    def _dequeue(self, chat_id, ticket, stage):
+        """Убирает отмененный запрос из очереди этапа stage"""
+        with self._lock:
+            queue = self._global_queue if stage == 'global' else self._chat_queues.get(chat_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                if not queue and stage == 'chat':
+                    del self._chat_queues[chat_id]
+
+    def _try_acquire(self, chat_id, ticket, stage):
+        """Один шаг ожидания: сначала токен чата, затем общий.
+
+        Токен берет только первый в очереди (по приоритету, затем по времени).
+        Возвращает (задержка, этап); этап None - оба токена получены.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._paused_until > now:
+                return self._paused_until - now, stage
+            if stage == 'chat':
+                queue = self._chat_queues[chat_id]
+                bucket = self._chat_bucket(chat_id, now)
+                delay = bucket.wait_time(now)
+                if queue[0] != ticket:
+                    return delay or 1 / self.global_rate, stage
+                if delay:
+                    return delay, stage
+                bucket.consume()
+                heapq.heappop(queue)
+                if not queue:
+                    del self._chat_queues[chat_id]
+                heapq.heappush(self._global_queue, ticket)
+                stage = 'global'
+            delay = self._global.wait_time(now)
+            if self._global_queue[0] != ticket:
+                return delay or 1 / self.global_rate, stage
+            if delay:
+                return delay, stage
+            self._global.consume()
+            heapq.heappop(self._global_queue)
+            return 0.0, None
+
+    async def _acquire(self, chat_id, priority):
+        ticket, stage = self._enqueue(chat_id, priority)
+        delayed = False
+        try:
+            while True:
+                delay, stage = self._try_acquire(chat_id, ticket, stage)
+                if stage is None:
+                    break
+                delayed = True
+                await asyncio.sleep(delay)
+        finally:
+            if stage is not None:
+                # Отмена во время ожидания
+                self._dequeue(chat_id, ticket, stage)
+        if delayed:
+            self.throttled += 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(_LIMITED_PREFIXES) and endpoint != 'answerCallbackQuery':
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get('chat_id')
+        priority = self._priority(endpoint, chat_id, rate_limit_args)
+        # Ответ на нажатие кнопки не расходует лимит чата
+        bucket_chat_id = None if endpoint == 'answerCallbackQuery' else chat_id
+        self.requests += 1
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(bucket_chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                with self._lock:
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Flood control Telegram ({endpoint}), все запросы ждут {e.retry_after} с")
+                if attempt == self.max_retries:
+                    raise
+
+    def stats(self):
+        """Счетчики ограничителя"""
+        with self._lock:
+            queued = [0, 0, 0]
+            for queue in (self._global_queue, *self._chat_queues.values()):
+                for priority, _ in queue:
+                    queued[priority] += 1
+            return {
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'retry_after': self.retry_after,
+                'queued': {
+                    'high': queued[PRIORITY_HIGH],
+                    'normal': queued[PRIORITY_NORMAL],
+                    'low': queued[PRIORITY_LOW],
+                },
+                'chat_buckets': len(self._chats),
+                'paused_for': max(0.0, self._paused_until - time.monotonic()),
+            }
+
+
+# Один ограничитель на процесс: и для бота PTB, и для Bot диспетчера
+rate_limiter = TelegramRateLimiter()
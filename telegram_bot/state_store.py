@@ -0,0 +1,162 @@
+"""Хранилище состояний диалогов (создание, возврат, закрытие заявки).
+
+Состояния живут в памяти в LRU-кэше с TTL: брошенные диалоги удаляются
+сами, а размер ограничен STATE_MAX_ENTRIES. При STATE_BACKEND=postgres
+изменения пачками сохраняются в таблицу bot_state и загружаются при старте,
+поэтому перезапуск бота не теряет недозаполненные заявки.
+
+Доступ синхронный, как к словарю: обработчики не ждут БД, запись в
+таблицу делает фоновая задача раз в STATE_FLUSH_INTERVAL секунд.
+"""
+import asyncio
+import logging
+import time
+
+from cache import LRUCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class StateMap:
+    """Состояния одного вида (namespace) по ключу, обычно user_id.
+
+    Значения - словари, сериализуемые в JSON. Вложенные значения нельзя
+    менять на месте: для изменения полей используйте :meth:`update`, иначе
+    изменение не попадет в БД.
+    """
+
+    def __init__(self, store, namespace, ttl):
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        value = self.store._get(self.namespace, str(key))
+        return default if value is None else dict(value)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.store._get(self.namespace, str(key)) is not None
+
+    def __setitem__(self, key, value):
+        self.store._set(self.namespace, str(key), dict(value), self.ttl)
+
+    def __delitem__(self, key):
+        self.store._delete(self.namespace, str(key))
+
+    def pop(self, key, default=None):
+        value = self.get(key)
+        if value is not None:
+            self.store._delete(self.namespace, str(key))
+            return value
+        return default
+
+    def items(self):
+        """Снимок всех непросроченных состояний (key, value)"""
+        return self.store._items(self.namespace)
+
+    def update(self, key, **fields):
+        """Меняет поля состояния; KeyError, если состояния нет или оно истекло"""
+        value = self[key]
+        value.update(fields)
+        self[key] = value
+
+
+class StateStore:
+    """Память (LRU + TTL) и необязательное сохранение в PostgreSQL"""
+
+    def __init__(self, backend=None, maxsize=None, ttl=None, flush_interval=None):
+        self.backend = backend or Config.STATE_BACKEND
+        self.ttl = ttl or Config.STATE_TTL
+        self.flush_interval = flush_interval or Config.STATE_FLUSH_INTERVAL
+        self._cache = LRUCache(maxsize=maxsize or Config.STATE_MAX_ENTRIES, ttl=self.ttl)
+        # (namespace, key) -> (value, expires_at) или None для удаления
+        self._dirty = {}
+        self._db = None
+        self._task = None
+
+    def map(self, namespace, ttl=None):
+        return StateMap(self, namespace, ttl or self.ttl)
+
+    def _get(self, namespace, key):
+        return self._cache.get((namespace, key))
+
+    def _items(self, namespace):
+        return [(key, dict(value)) for (ns, key), value in self._cache.items() if ns == namespace]
+
+    def _set(self, namespace, key, value, ttl):
+        self._cache.set((namespace, key), value, ttl=ttl)
+        if self._persistent:
+            self._dirty[(namespace, key)] = (value, time.time() + ttl)
+
+    def _delete(self, namespace, key):
+        self._cache.invalidate((namespace, key))
+        if self._persistent:
+            self._dirty[(namespace, key)] = None
+
+    @property
+    def _persistent(self):
+        return self.backend == 'postgres'
+
+    async def start(self, db):
+        """Загружает сохраненные состояния и запускает фоновую запись.
+
+        Повторный вызов ничего не делает.
+        """
+        if not self._persistent or self._db is not None:
+            return
+        self._db = db
+        now = time.time()
+        rows = await db.load_state()
+        for row in rows:
+            ttl = row['expires_at'] - now
+            if ttl > 0:
+                self._cache.set((row['namespace'], row['key']), row['value'], ttl=ttl)
+        logger.info(f"Загружено состояний диалогов: {len(rows)}")
+        self._task = asyncio.create_task(self._flush_loop(), name='state-flush')
+
+    async def stop(self):
+        """Останавливает фоновую запись и сохраняет оставшиеся изменения"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения состояний диалогов: {e}")
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией и удаляет истекшие"""
+        dirty, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for (namespace, key), item in dirty.items():
+            if item is None:
+                deletes.append((namespace, key))
+            else:
+                upserts.append((namespace, key, *item))
+        try:
+            await self._db.save_state(upserts, deletes)
+        except Exception:
+            # Не потерять изменения: вернуть их, если не перезаписаны новыми
+            for entry, item in dirty.items():
+                self._dirty.setdefault(entry, item)
+            raise
+
+    def stats(self):
+        return {**self._cache.stats(), 'dirty': len(self._dirty), 'backend': self.backend}
+
+
+state_store = StateStore()
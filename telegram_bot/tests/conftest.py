@@ -0,0 +1,22 @@
+"""Общая настройка тестов.
+
+Модули бота лежат в корне telegram_bot и импортируются без пакета.
+config читает окружение при импорте, поэтому обязательные переменные
+получают тестовые значения до первого импорта.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault('BOT_TOKEN', '123456:TEST-TOKEN')
+os.environ.setdefault('DATABASE_URL', os.getenv('TEST_DATABASE_URL', 'postgresql://localhost/telegram_bot_test'))
+os.environ.setdefault('BOT_API_KEY', 'test-api-key')
+os.environ.setdefault('TELEGRAM_WEBHOOK_SECRET', 'test-webhook-secret')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'benchmark: замеры производительности (пропустить: -m "not benchmark")'
+    )
@@ -0,0 +1,74 @@
+"""Текст карточек заявок (cards.py): лимиты Telegram и экранирование Markdown"""
+import re
+
+import pytest
+from telegram.constants import MessageLimit
+
+import cards
+from cards import CARD_ACCEPTED, CARD_NEW, CARD_RETURNED, render_card
+
+_EMOJI = '🔥👍🏽🚀'  # символы вне BMP: по две единицы UTF-16
+
+
+def _length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _assert_valid_markdown(text):
+    """Каждый служебный символ Markdown (V1) экранирован, висящего слэша нет"""
+    assert not re.search(r'(?<!\\)[_*`\[]', text), text
+    assert not text.endswith('\\')
+    # Строка кодируется: суррогатные пары не разорваны
+    text.encode('utf-8')
+
+
+def _application(**fields):
+    application = {
+        'id': 7, 'version': None, 'address': 'ул. Ленина, 1', 'task': 'Починить кран',
+        'comment': '', 'username': 'user', 'accepted_username': 'worker',
+        'return_reason': 'нет времени', 'returned_username': 'worker',
+    }
+    application.update(fields)
+    return application
+
+
+def test_escapes_markup_in_fields():
+    text = render_card(_application(username='a_b*c', task='[x] `y`'), CARD_NEW)
+    assert 'a\\_b\\*c' in text
+    _assert_valid_markdown(text.replace('@', ''))
+
+
+@pytest.mark.parametrize('caption, limit', [
+    (True, MessageLimit.CAPTION_LENGTH),
+    (False, MessageLimit.MAX_TEXT_LENGTH),
+])
+def test_long_emoji_fields_fit(caption, limit):
+    application = _application(task=(_EMOJI + '_*') * 2000, comment=_EMOJI * 3000)
+    text = render_card(application, CARD_RETURNED, caption=caption)
+    assert _length(text) <= limit
+    _assert_valid_markdown(text)
+
+
+@pytest.mark.parametrize('limit', range(40, 90))
+def test_short_fields_cut_in_utf16_units(limit):
+    # Длинные поля уже сокращены, превышение дают короткие: обрезка последней
+    # мерой должна считать единицы UTF-16 и не разрывать экранирование
+    compiled = cards._COMPILED[CARD_ACCEPTED]
+    raw = {
+        'id': 7, 'address': 'а', 'task': 'з', 'comment': None,
+        'username': (_EMOJI + '_*') * 10, 'accepted_username': ('*' + _EMOJI) * 10,
+    }
+    text = cards._fit(compiled, raw, limit)
+    assert _length(text) <= limit
+    assert text.endswith(cards._ELLIPSIS)
+    _assert_valid_markdown(text)
+
+
+def test_cached_by_version():
+    application = _application(id=8, version=3)
+    first = render_card(application, CARD_NEW)
+    application['task'] = 'другая задача'
+    # Та же версия строки - тот же текст; новая версия - перерисовка
+    assert render_card(application, CARD_NEW) == first
+    application['version'] = 4
+    assert 'другая задача' in render_card(application, CARD_NEW)
@@ -0,0 +1,157 @@
+"""Прием JSON-заявки с сайта: валидация в SiteApplication и замер CPU.
+
+Неверные заявки должны отклоняться до обращения к БД: пул в тестах
+не открыт, и любое обращение к нему дало бы 500 вместо 400/413.
+"""
+import base64
+import json
+import os
+import time
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+import webhook
+from config import Config
+from models import Application
+from webhook import SiteApplication, parse_site_application
+
+URL = '/webhook/application'
+HEADERS = {'X-API-Key': Config.API_KEY}
+
+VALID = {
+    'name': 'Иван Петров',
+    'phone': '+79991234567',
+    'address': 'г. Москва, ул. Ленина, д. 1, кв. 2',
+    'task': 'Починить кран на кухне, течет под раковиной',
+    'comment': 'Звонить после 18:00',
+    'site_user_id': '12345',
+}
+
+
+@pytest.fixture
+def client():
+    return TestClient(webhook.app)
+
+
+def test_parse_valid():
+    site_app = parse_site_application(orjson.dumps(VALID))
+    application = site_app.to_application()
+    assert application.user_id == -12345
+    assert application.username == VALID['name']
+    assert application.phone == VALID['phone']
+
+
+def test_site_user_id_as_number():
+    site_app = parse_site_application(orjson.dumps({**VALID, 'site_user_id': 777}))
+    assert site_app.to_application().user_id == -777
+
+
+def test_anonymous_site_user():
+    data = {key: value for key, value in VALID.items() if key != 'site_user_id'}
+    assert parse_site_application(orjson.dumps(data)).to_application().user_id == -1
+
+
+@pytest.mark.parametrize('change', [
+    {'phone': None},
+    {'phone': '1' * 21},  # phone VARCHAR(20)
+    {'name': 'x' * 101},  # username VARCHAR(100)
+    {'task': ''},
+    {'site_user_id': '12a'},
+    {'photo_base64': 'A' * (Config.PHOTO_MAX_BYTES * 4 // 3 + 8)},
+])
+def test_parse_invalid(change):
+    data = {**VALID, **change}
+    data = {key: value for key, value in data.items() if value is not None}
+    with pytest.raises(ValidationError):
+        parse_site_application(orjson.dumps(data))
+
+
+def test_rejects_missing_field(client):
+    data = {key: value for key, value in VALID.items() if key != 'address'}
+    response = client.post(URL, content=orjson.dumps(data), headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json()['detail'][0]['loc'] == ['address']
+
+
+def test_rejects_malformed_json(client):
+    response = client.post(URL, content=b'{"name": ', headers=HEADERS)
+    assert response.status_code == 400
+
+
+def test_rejects_non_object(client):
+    response = client.post(URL, content=b'[1, 2]', headers=HEADERS)
+    assert response.status_code == 400
+
+
+def test_rejects_oversized_body(client):
+    body = b'{"photo_base64": "' + b'A' * webhook.APPLICATION_MAX_BYTES + b'"}'
+    response = client.post(URL, content=body, headers=HEADERS)
+    assert response.status_code == 413
+
+
+def test_requires_api_key(client):
+    response = client.post(URL, content=orjson.dumps(VALID))
+    assert response.status_code == 403
+
+
+def _baseline(body):
+    """Путь до перехода на SiteApplication: json.loads и проверка полей вручную"""
+    data = json.loads(body)
+    for field in ('name', 'phone', 'address', 'task'):
+        if field not in data:
+            raise ValueError(field)
+    Application(
+        user_id=-int(data.get('site_user_id', '0')) or -1,
+        username=data['name'], address=data['address'], phone=data['phone'],
+        task=data['task'], comment=data.get('comment', ''), photo_file_id=None
+    )
+    return json.dumps({'status': 'success', 'application_id': 1}).encode()
+
+
+def _validate_json(body):
+    """model_validate_json - разбор парсером pydantic-core"""
+    SiteApplication.model_validate_json(body).to_application()
+    return orjson.dumps({'status': 'success', 'application_id': 1})
+
+
+def _current(body):
+    parse_site_application(body).to_application()
+    return orjson.dumps({'status': 'success', 'application_id': 1})
+
+
+def _best_time(func, body, rounds, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(body)
+        best = min(best, (time.perf_counter() - start) / rounds)
+    return best
+
+
+@pytest.mark.benchmark
+def test_json_path_benchmark():
+    """CPU на разбор, валидацию и ответ для заявки без фото и с фото 300 КБ"""
+    payloads = {
+        'без фото': (orjson.dumps(VALID), 2000),
+        'фото 300 КБ': (orjson.dumps({**VALID, 'photo_base64': base64.b64encode(os.urandom(300_000)).decode()}), 50),
+    }
+    results = {}
+    for name, (body, rounds) in payloads.items():
+        results[name] = [
+            _best_time(func, body, rounds) for func in (_baseline, _validate_json, _current)
+        ]
+        baseline, validate_json, current = results[name]
+        print(
+            f"\n{name}: json.loads + ручная проверка {baseline * 1e6:.1f} мкс, "
+            f"model_validate_json {validate_json * 1e6:.1f} мкс, "
+            f"orjson + model_validate {current * 1e6:.1f} мкс"
+        )
+    # Без фото все три пути укладываются в несколько микросекунд; на фото
+    # время уходит на разбор длинной строки, и orjson заметно быстрее
+    baseline, validate_json, current = results['фото 300 КБ']
+    assert current < baseline
+    assert current < validate_json
@@ -0,0 +1,113 @@
+"""Прием обновлений Telegram через вебхук HTTP-сервера (UPDATE_MODE=webhook).
+
+Вместо Telegram запросы шлет TestClient так же, как их шлет Bot API:
+JSON обновления и секрет из set_webhook в заголовке
+X-Telegram-Bot-Api-Secret-Token. Вместо приложения бота - объект с Bot
+и update_queue, в которую обработчик кладет обновления.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from telegram import Bot, Update
+
+import webhook
+from config import Config
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def _update(update_id=1001):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': 5,
+            'date': 1700000000,
+            'chat': {'id': 42, 'type': 'private'},
+            'from': {'id': 42, 'is_bot': False, 'first_name': 'Иван'},
+            'text': '/start',
+        },
+    }
+
+
+@pytest.fixture
+def bot_application(monkeypatch):
+    application = SimpleNamespace(bot=Bot(Config.BOT_TOKEN), update_queue=asyncio.Queue())
+    monkeypatch.setattr(webhook, 'bot_application', application)
+    return application
+
+
+@pytest.fixture
+def client():
+    # Без контекстного менеджера lifespan не запускается: БД и диспетчер не нужны
+    return TestClient(webhook.app)
+
+
+def _deliver(client, payload, secret=Config.TELEGRAM_WEBHOOK_SECRET):
+    """Запрос, как его отправляет Telegram"""
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return client.post(Config.TELEGRAM_WEBHOOK_PATH, json=payload, headers=headers)
+
+
+def test_update_is_queued(client, bot_application):
+    response = _deliver(client, _update(1001))
+    assert response.status_code == 200
+    assert response.json() == {'ok': True}
+    update = bot_application.update_queue.get_nowait()
+    assert isinstance(update, Update)
+    assert update.update_id == 1001
+    assert update.effective_user.id == 42
+    assert update.message.text == '/start'
+    assert bot_application.update_queue.empty()
+
+
+def test_updates_are_queued_in_order(client, bot_application):
+    for update_id in (1, 2, 3):
+        assert _deliver(client, _update(update_id)).status_code == 200
+    queued = [bot_application.update_queue.get_nowait().update_id for _ in range(3)]
+    assert queued == [1, 2, 3]
+
+
+def test_missing_secret(client, bot_application):
+    response = _deliver(client, _update(), secret=None)
+    assert response.status_code == 403
+    assert bot_application.update_queue.empty()
+
+
+def test_wrong_secret(client, bot_application):
+    response = _deliver(client, _update(), secret='not-the-secret')
+    assert response.status_code == 403
+    assert bot_application.update_queue.empty()
+
+
+def test_no_secret_configured(client, bot_application, monkeypatch):
+    # Без TELEGRAM_WEBHOOK_SECRET вебхук закрыт, даже для пустого заголовка
+    monkeypatch.setattr(Config, 'TELEGRAM_WEBHOOK_SECRET', None)
+    response = _deliver(client, _update(), secret='')
+    assert response.status_code == 403
+    assert bot_application.update_queue.empty()
+
+
+def test_invalid_update(client, bot_application):
+    response = client.post(
+        Config.TELEGRAM_WEBHOOK_PATH, content=b'{not json',
+        headers={SECRET_HEADER: Config.TELEGRAM_WEBHOOK_SECRET}
+    )
+    assert response.status_code == 400
+    assert bot_application.update_queue.empty()
+
+
+def test_oversized_update(client, bot_application):
+    payload = _update()
+    payload['message']['text'] = 'x' * webhook.TELEGRAM_UPDATE_MAX_BYTES
+    response = _deliver(client, payload)
+    assert response.status_code == 413
+    assert bot_application.update_queue.empty()
+
+
+def test_bot_not_running(client, monkeypatch):
+    # Режим api: бота в процессе нет, Telegram повторит доставку позже
+    monkeypatch.setattr(webhook, 'bot_application', None)
+    response = _deliver(client, _update())
+    assert response.status_code == 503
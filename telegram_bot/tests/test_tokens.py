@@ -0,0 +1,90 @@
+"""Подписанные токены ссылок "Получить данные заявки" (tokens.py)"""
+import base64
+import time
+
+import pytest
+
+import tokens
+from tokens import InvalidToken, TokenExpired, make_token, verify_token
+
+
+def _raw(token):
+    return bytearray(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode()
+
+
+def test_roundtrip():
+    token = make_token(42, 123456789012)
+    assert verify_token(token) == (42, 123456789012)
+
+
+def test_token_fits_start_parameter():
+    # t.me/<бот>?start=token_<токен>: параметр start не длиннее 64 символов
+    token = make_token(2**32 - 1, -(2**63))
+    assert len('token_' + token) <= 64
+    assert all(c.isalnum() or c in '-_' for c in token)
+
+
+def test_expired():
+    token = make_token(1, 2, ttl=-1)
+    with pytest.raises(TokenExpired):
+        verify_token(token)
+
+
+def test_expires_after_ttl(monkeypatch):
+    token = make_token(1, 2, ttl=60)
+    now = time.time()
+    monkeypatch.setattr(tokens.time, 'time', lambda: now + 59)
+    assert verify_token(token) == (1, 2)
+    monkeypatch.setattr(tokens.time, 'time', lambda: now + 61)
+    with pytest.raises(TokenExpired):
+        verify_token(token)
+
+
+@pytest.mark.parametrize('offset', [0, 4, 12, 15, 16, 25])
+def test_tampered_byte(offset):
+    # Любой измененный байт - id заявки, пользователя, срок или подпись
+    raw = _raw(make_token(7, 8))
+    raw[offset] ^= 0x01
+    with pytest.raises(InvalidToken) as excinfo:
+        verify_token(_encode(raw))
+    assert not isinstance(excinfo.value, TokenExpired)
+
+
+def test_extended_expiry_is_rejected():
+    # Продлить истекший токен, переписав срок, нельзя: подпись не сойдется
+    raw = _raw(make_token(7, 8, ttl=-10))
+    raw[12:16] = int(time.time() + 3600).to_bytes(4, 'big')
+    with pytest.raises(InvalidToken) as excinfo:
+        verify_token(_encode(raw))
+    assert not isinstance(excinfo.value, TokenExpired)
+
+
+def test_other_key(monkeypatch):
+    token = make_token(7, 8)
+    monkeypatch.setattr(tokens, '_KEY', b'\x00' * 32)
+    with pytest.raises(InvalidToken):
+        verify_token(token)
+
+
+@pytest.mark.parametrize('token', ['', 'abc', '!!!!', make_token(1, 2)[:-1], make_token(1, 2) + 'AA'])
+def test_malformed(token):
+    with pytest.raises(InvalidToken):
+        verify_token(token)
+
+
+@pytest.mark.benchmark
+def test_verify_benchmark():
+    """Стоимость проверки токена: HMAC-SHA256 и разбор, без обращения к хранилищу"""
+    token = make_token(42, 123456789)
+    rounds = 20000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        verify_token(token)
+    per_call = (time.perf_counter() - start) / rounds
+    print(f"\nverify_token: {per_call * 1e6:.2f} мкс на проверку")
+    # С большим запасом: проверка не должна быть заметной на фоне запроса к Telegram
+    assert per_call < 100e-6
@@ -0,0 +1,129 @@
+"""Параллельная обработка обновлений с порядком по пользователю (update_processor.py).
+
+Обработчик имитирует запрос к Telegram паузой. Обновления подаются так же,
+как их подает Application: при concurrent_updates каждое - отдельной
+задачей через process_update, без него - по одному.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+from telegram.ext import SimpleUpdateProcessor
+
+from update_processor import PerUserUpdateProcessor, update_key
+
+
+def _message_update(update_id, user_id, chat_id=None):
+    chat_id = chat_id or user_id
+    message = Message(
+        update_id, datetime(2024, 1, 1),
+        Chat(chat_id, Chat.PRIVATE if chat_id == user_id else Chat.SUPERGROUP),
+        from_user=User(user_id, 'user', False), text=str(update_id)
+    )
+    return Update(update_id, message=message)
+
+
+def _updates(users, per_user):
+    """Обновления users пользователей вперемешку, по per_user от каждого"""
+    return [
+        _message_update(step * users + user, 1000 + user)
+        for step in range(per_user)
+        for user in range(users)
+    ]
+
+
+async def _process(processor, updates, handler):
+    async with processor:
+        await asyncio.gather(*(
+            asyncio.ensure_future(processor.process_update(update, handler(update)))
+            for update in updates
+        ))
+
+
+async def _process_sequentially(updates, handler):
+    # Application без concurrent_updates ждет каждое обновление
+    for update in updates:
+        await handler(update)
+
+
+def test_update_key():
+    assert update_key(_message_update(1, 42)) == ('user', 42)
+    # Нажатия в группе разных пользователей - разные очереди
+    assert update_key(_message_update(2, 42, chat_id=-100)) == ('user', 42)
+    assert update_key(Update(3)) is None
+    assert update_key(object()) is None
+
+
+def test_per_user_order_is_kept():
+    updates = _updates(users=10, per_user=8)
+    done = []
+
+    async def handler(update):
+        await asyncio.sleep(random.uniform(0, 0.003))
+        done.append(update)
+
+    asyncio.run(_process(PerUserUpdateProcessor(max_concurrent=4), updates, handler))
+
+    assert sorted(u.update_id for u in done) == sorted(u.update_id for u in updates)
+    for user_id in {u.effective_user.id for u in updates}:
+        sent = [u.update_id for u in updates if u.effective_user.id == user_id]
+        processed = [u.update_id for u in done if u.effective_user.id == user_id]
+        assert processed == sent
+
+
+def test_concurrency_cap():
+    running = peak = 0
+
+    async def handler(update):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.002)
+        running -= 1
+
+    asyncio.run(_process(PerUserUpdateProcessor(max_concurrent=3), _updates(users=12, per_user=2), handler))
+    assert peak == 3
+
+
+def test_slow_user_does_not_block_others():
+    # Очередь медленного пользователя не занимает слоты остальных
+    finished = {}
+    start = time.perf_counter()
+
+    async def handler(update):
+        await asyncio.sleep(0.05 if update.effective_user.id == 1 else 0.001)
+        finished[update.update_id] = time.perf_counter() - start
+
+    slow = [_message_update(i, 1) for i in range(1, 6)]
+    fast = [_message_update(100 + i, 2 + i) for i in range(10)]
+    asyncio.run(_process(PerUserUpdateProcessor(max_concurrent=2), slow + fast, handler))
+    assert max(finished[u.update_id] for u in fast) < 0.05
+
+
+@pytest.mark.benchmark
+def test_throughput_benchmark():
+    """Пропускная способность: последовательная обработка против параллельной"""
+    updates = _updates(users=20, per_user=5)
+    latency = 0.01  # один запрос к Telegram в обработчике
+
+    async def handler(update):
+        await asyncio.sleep(latency)
+
+    def measure(run):
+        start = time.perf_counter()
+        asyncio.run(run())
+        return len(updates) / (time.perf_counter() - start)
+
+    sequential = measure(lambda: _process_sequentially(updates, handler))
+    simple = measure(lambda: _process(SimpleUpdateProcessor(16), updates, handler))
+    per_user = measure(lambda: _process(PerUserUpdateProcessor(16), updates, handler))
+    print(
+        f"\nобновлений в секунду: последовательно {sequential:.0f}, "
+        f"SimpleUpdateProcessor(16) без порядка {simple:.0f}, "
+        f"PerUserUpdateProcessor(16) {per_user:.0f}"
+    )
+    # 20 пользователей по 5 обновлений: до 16 параллельно при сохранении порядка
+    assert per_user > sequential * 5
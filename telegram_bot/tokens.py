@@ -0,0 +1,64 @@
+"""Подписанные токены для ссылок t.me/<бот>?start=token_<токен>.
+
+Токен содержит id заявки, id пользователя и срок действия и подписан
+HMAC-SHA256, поэтому проверяется без хранения на сервере: переживает
+перезапуск и работает на любой реплике с тем же секретом.
+
+Формат: base64url(app_id:4 | user_id:8 | expires:4 | hmac[:10]), 35 символов,
+что укладывается в 64-символьный параметр start.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+
+from config import Config
+
+_PAYLOAD = struct.Struct('>IqI')
+_MAC_SIZE = 10
+_TOKEN_SIZE = _PAYLOAD.size + _MAC_SIZE
+
+# Ключ подписи: TOKEN_SECRET или производный от токена бота
+_KEY = hashlib.sha256(
+    b'deep-link-token:' + (Config.TOKEN_SECRET or Config.BOT_TOKEN or '').encode()
+).digest()
+
+
+class InvalidToken(Exception):
+    """Токен поврежден или подписан другим ключом"""
+
+
+class TokenExpired(InvalidToken):
+    """Срок действия токена истек"""
+
+
+def _sign(payload):
+    return hmac.new(_KEY, payload, hashlib.sha256).digest()[:_MAC_SIZE]
+
+
+def make_token(app_id, user_id, ttl=3600):
+    """Токен доступа пользователя user_id к данным заявки app_id на ttl секунд"""
+    payload = _PAYLOAD.pack(app_id, user_id, int(time.time() + ttl))
+    return base64.urlsafe_b64encode(payload + _sign(payload)).rstrip(b'=').decode()
+
+
+def verify_token(token):
+    """Проверяет токен и возвращает (app_id, user_id).
+
+    InvalidToken - если токен поврежден или подделан, TokenExpired - если истек.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise InvalidToken("Неверный формат токена") from None
+    if len(raw) != _TOKEN_SIZE:
+        raise InvalidToken("Неверная длина токена")
+    payload, mac = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(mac, _sign(payload)):
+        raise InvalidToken("Неверная подпись токена")
+    app_id, user_id, expires = _PAYLOAD.unpack(payload)
+    if time.time() > expires:
+        raise TokenExpired("Срок действия токена истек")
+    return app_id, user_id
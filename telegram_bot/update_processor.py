@@ -0,0 +1,72 @@
+"""Параллельная обработка обновлений с сохранением порядка для каждого пользователя"""
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений может ждать своей очереди одновременно
+_MAX_PENDING_UPDATES = 1024
+
+
+def update_key(update):
+    """Ключ очереди обновления: пользователь, для обновлений без него - чат.
+
+    Тот же ключ использует catchup, чтобы порядок при догоне совпадал
+    с порядком при обычной работе (диалог возврата: кнопка в группе ->
+    текст в личке одного пользователя).
+    """
+    if isinstance(update, Update):
+        if update.effective_user:
+            return 'user', update.effective_user.id
+        if update.effective_chat:
+            return 'chat', update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных пользователей параллельно, одного - по порядку.
+
+    Ключ очереди - пользователь (в личном чате он совпадает с чатом), а для
+    обновлений без пользователя - чат. Нажатия разных исполнителей в группе
+    обрабатываются параллельно, а шаги диалога одного пользователя
+    (адрес -> телефон -> ...) не переставляются.
+
+    Ограничение max_concurrent применяется после очереди пользователя:
+    обновления, ждущие предыдущих от того же пользователя, не занимают слоты
+    и не задерживают остальных.
+    """
+
+    def __init__(self, max_concurrent):
+        super().__init__(max(_MAX_PENDING_UPDATES, max_concurrent))
+        self.max_concurrent = max_concurrent
+        self._running = asyncio.BoundedSemaphore(max_concurrent)
+        self._locks = {}  # ключ -> [Lock, число обновлений в очереди]
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
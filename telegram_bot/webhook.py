@@ -1,24 +1,95 @@
 from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from fastapi.security import APIKeyHeader
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Optional, Sequence
+from contextlib import asynccontextmanager
 import uvicorn
 import asyncio
-import threading
 import base64
-import tempfile
-import os
-from database import db
+import hashlib
+import hmac
+import orjson
+from database import Database
 from models import Application
-from telegram import Bot, InputFile
+from telegram import InputFile, Update
 from config import Config
-from keyboards import get_application_keyboard
+from dispatcher import OutboundDispatcher
+from outbox import OutboxRelay
+from ratelimit import rate_limiter, PRIORITY_NORMAL
+from cache import LRUCache
 import logging
 import aiofiles
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Собственный пул соединений с БД в event loop HTTP-сервера.
+# В режиме одного event loop с ботом заменяется пулом бота (share_resources)
+db = Database(
+    min_size=Config.API_DB_POOL_MIN_SIZE,
+    max_size=Config.API_DB_POOL_MAX_SIZE
+)
+
+# Тело JSON-заявки: фото в base64 и текстовые поля
+APPLICATION_MAX_BYTES = Config.PHOTO_MAX_BYTES * 4 // 3 + 64 * 1024
+# Тело обновления от Telegram: текст сообщения до 4096 символов с разметкой
+TELEGRAM_UPDATE_MAX_BYTES = 256 * 1024
+
+# Недавние ключи идемпотентности -> id заявки, чтобы повторы не ходили в БД
+idempotency_cache = LRUCache(maxsize=10000, ttl=Config.IDEMPOTENCY_CACHE_TTL)
+
+# Один Bot и пул воркеров на весь HTTP-сервер
+dispatcher = OutboundDispatcher()
+# Отправка карточек заявок из outbox
+relay = OutboxRelay(db, dispatcher)
+
+# True, если БД и диспетчер принадлежат боту в том же event loop
+_shared = False
+# Приложение бота, в update_queue которого кладутся обновления от Telegram
+bot_application = None
+
+def share_resources(bot_db: Database, bot_dispatcher: OutboundDispatcher, application=None):
+    """Использовать пул БД и диспетчер (а значит, и Bot) приложения бота.
+
+    Вызывается до запуска сервера в режиме одного event loop (main.run_all).
+    Открытием и закрытием ресурсов тогда управляет бот, а карточки из outbox
+    отправляет relay бота. application нужен для приема обновлений Telegram
+    через вебхук (UPDATE_MODE=webhook).
+    """
+    global db, dispatcher, relay, _shared, bot_application
+    db = bot_db
+    dispatcher = bot_dispatcher
+    relay = None
+    _shared = True
+    bot_application = application
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if _shared:
+        yield
+        return
+    if not Config.PHOTO_STORAGE_CHAT_ID:
+        # Свой rate_limiter у каждого процесса: загрузки фото в группу
+        # не учитываются в лимите бота (см. ratelimit)
+        logger.warning(
+            "PHOTO_STORAGE_CHAT_ID не задан: фото с сайта загружаются в группу "
+            "исполнителей в обход ограничителя процесса бота"
+        )
+    await db.connect()
+    await dispatcher.start()
+    # В раздельном режиме карточки может отправлять и процесс бота
+    if Config.API_OUTBOX_RELAY:
+        await relay.start()
+    yield
+    if Config.API_OUTBOX_RELAY:
+        await relay.stop()
+    await dispatcher.stop()
+    await db.close()
+
+# orjson для ответов быстрее стандартного json
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # 👇 Настройка заголовка для API ключа
 api_key_header = APIKeyHeader(name='X-API-Key', auto_error=False)
@@ -42,14 +113,42 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
     return api_key
 
 class SiteApplication(BaseModel):
-    name: str
-    phone: str
-    address: str
-    task: str
-    comment: Optional[str] = ""
-    photo_base64: Optional[str] = None
-    photo_filename: Optional[str] = None
-    site_user_id: Optional[str] = None
+    """Заявка с сайта. Ограничения длины соответствуют колонкам applications"""
+    name: str = Field(min_length=1, max_length=100)  # username VARCHAR(100)
+    phone: str = Field(min_length=1, max_length=20)  # phone VARCHAR(20)
+    address: str = Field(min_length=1, max_length=1000)
+    task: str = Field(min_length=1, max_length=3000)
+    comment: Optional[str] = Field("", max_length=3000)
+    photo_base64: Optional[str] = Field(None, max_length=Config.PHOTO_MAX_BYTES * 4 // 3 + 4)
+    photo_filename: Optional[str] = Field(None, max_length=255)
+    site_user_id: Optional[str] = Field(None, max_length=18, pattern=r'^\d*$')
+
+    @field_validator('site_user_id', mode='before')
+    @classmethod
+    def site_user_id_to_str(cls, value):
+        # Сайт может прислать id числом
+        return str(value) if isinstance(value, int) else value
+
+    def to_application(self, photo_file_id: Optional[str] = None) -> Application:
+        """Заявка в формате бота; пользователи сайта получают отрицательный user_id"""
+        return Application(
+            user_id=-int(self.site_user_id or '0') or -1,
+            username=self.name,
+            address=self.address,
+            phone=self.phone,
+            task=self.task,
+            comment=self.comment or '',
+            photo_file_id=photo_file_id
+        )
+
+def parse_site_application(body: bytes) -> SiteApplication:
+    """Заявка из JSON-тела запроса.
+
+    На заявках с фото в base64 orjson с model_validate заметно быстрее
+    model_validate_json (замер - tests/test_json_path.py). orjson.JSONDecodeError
+    для неверного JSON, ValidationError для неверных полей.
+    """
+    return SiteApplication.model_validate(orjson.loads(body))
 
 # 👇 Добавьте зависимость verify_api_key к эндпоинту
 @app.post("/webhook/application")
@@ -58,47 +157,64 @@ async def receive_application(
     api_key: str = Depends(verify_api_key)  # 👈 Проверка ключа
 ):
     """Эндпоинт для получения заявок с сайта"""
+    form = None
     try:
-        data = await request.json()
-        logger.info(f"Получена заявка с сайта: {data.get('name')}, фото: {'есть' if data.get('photo_base64') else 'нет'}")
+        # JSON или multipart сразу валидируется в модель - до обращения к БД
+        uploads = []
+        try:
+            if request.headers.get('content-type', '').startswith('multipart/form-data'):
+                fields, uploads, form = await read_multipart_application(request)
+                site_app = SiteApplication.model_validate(fields)
+            else:
+                site_app = parse_site_application(await read_body(request, APPLICATION_MAX_BYTES))
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Неверный JSON")
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=e.errors(include_url=False, include_context=False, include_input=False))
+        data = site_app.model_dump()
+        has_photo = bool(site_app.photo_base64 or uploads)
+        logger.info(f"Получена заявка с сайта: {site_app.name}, фото: {'есть' if has_photo else 'нет'}")
         
-        # Валидация обязательных полей
-        required_fields = ['name', 'phone', 'address', 'task']
-        for field in required_fields:
-            if field not in data:
-                raise HTTPException(status_code=400, detail=f"Отсутствует поле {field}")
-        
-        # Создаем заявку в формате бота
-        user_id = -int(data.get('site_user_id', '0')) or -1
+        # Повтор запроса (например, после таймаута на стороне сайта)
+        # возвращает исходную заявку без вставки, загрузки фото и отправки
+        upload_digests = [await hash_upload(upload) for upload in uploads]
+        idempotency_key = make_idempotency_key(request, data, upload_digests)
+        existing_id = await find_application_by_idempotency_key(idempotency_key)
+        if existing_id:
+            logger.info(f"Повторный запрос заявки #{existing_id}")
+            return {"status": "success", "application_id": existing_id, "duplicate": True}
         
-        # Если есть фото в base64 - сохраняем временно и получаем file_id
-        photo_file_id = None
-        if data.get('photo_base64'):
+        # Загружаем фото в Telegram и получаем file_id
+        photo_file_ids = []
+        if site_app.photo_base64:
             try:
-                photo_file_id = await save_base64_photo(data['photo_base64'])
-                logger.info(f"Фото сохранено, file_id: {photo_file_id}")
+                photo_file_ids.append(await save_base64_photo(site_app.photo_base64))
             except Exception as e:
                 logger.error(f"Ошибка сохранения фото: {e}")
+        for upload, digest in zip(uploads, upload_digests):
+            try:
+                photo_file_ids.append(await save_uploaded_photo(upload, digest))
+            except Exception as e:
+                logger.error(f"Ошибка сохранения фото {upload.filename}: {e}")
         
-        application = Application(
-            user_id=user_id,
-            username=data['name'],
-            address=data['address'],
-            phone=data['phone'],
-            task=data['task'],
-            comment=data.get('comment', ''),
-            photo_file_id=photo_file_id
-        )
+        # Первое фото прикладывается к заявке, остальные - ответом на карточку
+        photo_file_id = photo_file_ids[0] if photo_file_ids else None
+        if photo_file_id:
+            logger.info(f"Фото сохранено, file_id: {photo_file_id}")
         
-        # Сохраняем в БД
-        app_id = db.create_application(application)
-        logger.info(f"Заявка #{app_id} сохранена в БД")
+        # Создаем заявку в формате бота
+        application = site_app.to_application(photo_file_id)
         
-        # Отправляем в групповой чат
-        threading.Thread(
-            target=send_to_group_sync,
-            args=(app_id, application, photo_file_id)
-        ).start()
+        # Сохраняем в БД вместе с карточкой в outbox; при гонке двух
+        # одинаковых запросов вставит только один
+        app_id, created = await db.create_application_idempotent(
+            application, idempotency_key, extra_photo_file_ids=photo_file_ids[1:]
+        )
+        idempotency_cache.set(idempotency_key, app_id)
+        if not created:
+            logger.info(f"Повторный запрос заявки #{app_id}")
+            return {"status": "success", "application_id": app_id, "duplicate": True}
+        logger.info(f"Заявка #{app_id} сохранена в БД")
         
         return {"status": "success", "application_id": app_id}
         
@@ -107,12 +223,315 @@ async def receive_application(
     except Exception as e:
         logger.error(f"Ошибка обработки заявки: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if form is not None:
+            await form.close()
+
+def make_idempotency_key(request: Request, data: dict, upload_digests: Sequence[str]) -> str:
+    """Ключ идемпотентности заявки.
+
+    Берется из заголовка Idempotency-Key, а если его нет - из хэша
+    site_user_id и содержимого заявки (включая фото).
+    """
+    header = request.headers.get('idempotency-key')
+    if header:
+        return hashlib.sha256(f"key:{header}".encode()).hexdigest()
+    payload = orjson.dumps(
+        {'site_user_id': data.get('site_user_id'), 'data': data, 'photos': list(upload_digests)},
+        option=orjson.OPT_SORT_KEYS
+    )
+    return hashlib.sha256(b"payload:" + payload).hexdigest()
+
+async def find_application_by_idempotency_key(key: str) -> Optional[int]:
+    """id уже созданной по ключу заявки: сначала кэш в памяти, затем БД"""
+    app_id = idempotency_cache.get(key)
+    if app_id is None:
+        app_id = await db.get_application_id_by_idempotency_key(key)
+        if app_id is not None:
+            idempotency_cache.set(key, app_id)
+    return app_id
+
+@app.post("/webhook/applications/batch")
+async def receive_applications_batch(
+    request: Request,
+    api_key: str = Depends(verify_api_key)
+):
+    """Пакетный прием заявок с сайта (импорт из CRM, формы лидов).
+
+    Принимает JSON-массив заявок в формате SiteApplication. Все новые заявки
+    вставляются одним запросом в одной транзакции вместе с карточками в outbox.
+    Тело ограничено BATCH_MAX_BYTES. Фото в пакете принимаются, только если
+    задан PHOTO_STORAGE_CHAT_ID, и загружаются параллельно.
+    Возвращает результат по каждому
+    элементу: created / duplicate / error.
+    """
+    try:
+        items = orjson.loads(await read_body(request, Config.BATCH_MAX_BYTES))
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Неверный JSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив заявок")
+    if len(items) > Config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не больше {Config.BATCH_MAX_ITEMS} заявок за запрос")
+    
+    results = [None] * len(items)
+    valid = []  # (index, SiteApplication, idempotency_key)
+    batch_key = request.headers.get('idempotency-key')
+    for index, item in enumerate(items):
+        try:
+            site_app = SiteApplication.model_validate(item)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "error": e.errors(include_url=False, include_context=False, include_input=False)}
+            continue
+        if site_app.photo_base64 and not Config.PHOTO_STORAGE_CHAT_ID:
+            # Загрузка в группу исполнителей (20 сообщений в минуту) растянула
+            # бы запрос на минуты и задержала карточки заявок
+            results[index] = {"index": index, "status": "error", "error": "Фото в пакете требует PHOTO_STORAGE_CHAT_ID"}
+            continue
+        data = site_app.model_dump()
+        if batch_key:
+            key = hashlib.sha256(f"key:{batch_key}:{index}".encode()).hexdigest()
+        else:
+            key = make_idempotency_key(request, data, [])
+        valid.append((index, site_app, key))
+    
+    # Уже созданные заявки (повтор пакета) - одним запросом
+    known = {}
+    for _, _, key in valid:
+        app_id = idempotency_cache.get(key)
+        if app_id is not None:
+            known[key] = app_id
+    unknown_keys = [key for _, _, key in valid if key not in known]
+    if unknown_keys:
+        known.update(await db.get_application_ids_by_idempotency_keys(unknown_keys))
+    
+    pending = []  # (index, SiteApplication, key) - заявки, которые нужно создать
+    seen_keys = set()
+    for index, site_app, key in valid:
+        if key in known or key in seen_keys:
+            continue
+        seen_keys.add(key)
+        pending.append((index, site_app, key))
+    
+    photo_file_ids = await upload_batch_photos(
+        [(index, site_app.photo_base64) for index, site_app, _ in pending if site_app.photo_base64]
+    )
+    to_create = [
+        (index, site_app.to_application(photo_file_ids.get(index)), key)
+        for index, site_app, key in pending
+    ]
+    
+    try:
+        created = await db.create_applications_idempotent(
+            [(application, key) for _, application, key in to_create]
+        )
+    except Exception as e:
+        logger.error(f"Ошибка сохранения пакета заявок: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    for index, _, key in to_create:
+        app_id, is_new = created[key]
+        idempotency_cache.set(key, app_id)
+        if not is_new:
+            known[key] = app_id
+            continue
+        results[index] = {"index": index, "status": "created", "application_id": app_id}
+    
+    for index, _, key in valid:
+        if results[index] is None:
+            results[index] = {"index": index, "status": "duplicate", "application_id": known.get(key, created.get(key, (None,))[0])}
+    
+    logger.info(
+        f"Пакет заявок: всего {len(items)}, "
+        f"создано {sum(r['status'] == 'created' for r in results)}, "
+        f"ошибок {sum(r['status'] == 'error' for r in results)}"
+    )
+    return {"status": "success", "results": results}
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """Тело запроса не больше max_bytes, иначе 413.
+
+    Content-Length проверяется заранее, но тело считается по мере чтения:
+    при chunked-передаче заголовка нет.
+    """
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail="Слишком большой запрос")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail="Слишком большой запрос")
+    return bytes(body)
+
+async def upload_batch_photos(photos: Sequence[tuple]) -> dict:
+    """Параллельно загружает фото пакета: [(index, base64)] -> {index: file_id}.
+
+    Одновременно идет не больше BATCH_PHOTO_CONCURRENCY загрузок, одинаковые
+    фото загружаются один раз. Заявка, фото которой загрузить не удалось,
+    создается без фото.
+    """
+    semaphore = asyncio.Semaphore(Config.BATCH_PHOTO_CONCURRENCY)
+    uploads = {}  # sha256 -> задача загрузки
+    indexes = []  # (index, sha256)
+    
+    async def upload(photo_data, digest):
+        async with semaphore:
+            return await upload_photo(photo_data, digest)
+    
+    for index, base64_string in photos:
+        try:
+            photo_data = base64.b64decode(base64_string)
+            if not photo_data:
+                raise ValueError("пустое фото")
+        except Exception as e:
+            logger.error(f"Ошибка декодирования фото заявки {index} пакета: {e}")
+            continue
+        digest = hashlib.sha256(photo_data).hexdigest()
+        if digest not in uploads:
+            uploads[digest] = asyncio.ensure_future(upload(photo_data, digest))
+        indexes.append((index, digest))
+    if uploads:
+        await asyncio.gather(*uploads.values(), return_exceptions=True)
+    
+    file_ids = {}
+    for index, digest in indexes:
+        task = uploads[digest]
+        if task.exception() is not None:
+            logger.error(f"Ошибка сохранения фото заявки {index} пакета: {task.exception()}")
+            continue
+        file_ids[index] = task.result()
+    return file_ids
+
+
+# Текстовое поле multipart-заявки (самое длинное в модели - 3000 символов)
+MULTIPART_FIELD_MAX_BYTES = 64 * 1024
+
+
+class PartTooLarge(MultiPartException):
+    """Часть multipart или весь запрос больше лимита"""
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """MultiPartParser, считающий байты каждой части во время разбора.
+
+    Размер файла Starlette узнает только после записи части целиком, а при
+    chunked-передаче нет и Content-Length, поэтому разбор прерывается здесь,
+    как только часть превысила свой лимит.
+    """
+
+    def __init__(self, headers, stream, *, max_file_bytes: int, max_field_bytes: int, **kwargs):
+        super().__init__(headers, stream, **kwargs)
+        self.max_file_bytes = max_file_bytes
+        self.max_field_bytes = max_field_bytes
+        self._part_bytes = 0
+
+    def on_part_begin(self) -> None:
+        super().on_part_begin()
+        self._part_bytes = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._part_bytes += end - start
+        part = self._current_part
+        limit = self.max_field_bytes if part.file is None else self.max_file_bytes
+        if self._part_bytes > limit:
+            name = part.field_name if part.file is None else part.file.filename
+            raise PartTooLarge(f"Часть {name} больше {limit} байт")
+        super().on_part_data(data, start, end)
+
+
+async def limit_stream(stream, max_bytes: int):
+    """Поток тела запроса, прерываемый PartTooLarge после max_bytes"""
+    total = 0
+    async for chunk in stream:
+        total += len(chunk)
+        if total > max_bytes:
+            raise PartTooLarge("Слишком большой запрос")
+        yield chunk
+
+
+async def read_multipart_application(request: Request):
+    """Читает multipart-заявку: текстовые поля и части с изображениями.
+
+    Файлы разбираются потоково (Starlette держит в памяти не больше 1 МБ
+    каждого, остальное во временном файле). Байты считаются во время
+    разбора: часть больше PHOTO_MAX_BYTES или запрос больше суммарного лимита
+    прерывают чтение с 413. Возвращает (поля, файлы, форма); форму нужно
+    закрыть после загрузки фото.
+    """
+    max_total = Config.PHOTO_MAX_BYTES * Config.PHOTO_MAX_PARTS + 64 * 1024
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > max_total:
+        raise HTTPException(status_code=413, detail="Слишком большой запрос")
+    
+    parser = LimitedMultiPartParser(
+        request.headers,
+        limit_stream(request.stream(), max_total),
+        max_files=Config.PHOTO_MAX_PARTS,
+        max_fields=20,
+        max_file_bytes=Config.PHOTO_MAX_BYTES,
+        max_field_bytes=MULTIPART_FIELD_MAX_BYTES
+    )
+    try:
+        form = await parser.parse()
+    except PartTooLarge as e:
+        raise HTTPException(status_code=413, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Неверный multipart: {e}")
+    
+    data = {}
+    uploads = []
+    for key, value in form.multi_items():
+        if isinstance(value, UploadFile):
+            if not (value.content_type or '').startswith('image/'):
+                await form.close()
+                raise HTTPException(status_code=415, detail=f"Файл {value.filename} не является изображением")
+            uploads.append(value)
+        else:
+            data[key] = value
+    return data, uploads, form
+
+@app.post(Config.TELEGRAM_WEBHOOK_PATH, include_in_schema=False)
+async def receive_telegram_update(request: Request):
+    """Обновления от Telegram в режиме UPDATE_MODE=webhook.
+
+    Telegram передает секрет из set_webhook в заголовке
+    X-Telegram-Bot-Api-Secret-Token. Обновление только ставится в очередь
+    приложения бота, поэтому Telegram сразу получает ответ 200.
+    """
+    secret = request.headers.get('x-telegram-bot-api-secret-token', '')
+    if not Config.TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(
+        secret.encode(), Config.TELEGRAM_WEBHOOK_SECRET.encode()
+    ):
+        logger.warning("Запрос к вебхуку Telegram с неверным секретом")
+        raise HTTPException(status_code=403, detail="Неверный секрет")
+    
+    if bot_application is None:
+        # Бот не запущен в этом процессе (режим api) - Telegram повторит позже
+        raise HTTPException(status_code=503, detail="Бот не запущен")
+    
+    body = await read_body(request, TELEGRAM_UPDATE_MAX_BYTES)
+    try:
+        update = Update.de_json(orjson.loads(body), bot_application.bot)
+    except Exception as e:
+        logger.error(f"Неверное обновление от Telegram: {e}")
+        raise HTTPException(status_code=400, detail="Неверное обновление")
+    
+    await bot_application.update_queue.put(update)
+    return {"ok": True}
 
 # 👇 Добавьте защищенный эндпоинт для проверки
 @app.get("/health")
 async def health(api_key: str = Depends(verify_api_key)):
     """Проверка работоспособности с аутентификацией"""
-    return {"status": "healthy", "authenticated": True}
+    return {
+        "status": "healthy",
+        "authenticated": True,
+        "application_cache": db.cache.stats(),
+        "dispatcher": dispatcher.stats(),
+        "outbox": relay.stats() if relay and Config.API_OUTBOX_RELAY else None,
+        "rate_limiter": rate_limiter.stats()
+    }
 
 # 👇 Открытый эндпоинт (без аутентификации) для базовой проверки
 @app.get("/ping")
@@ -121,97 +540,72 @@ async def ping():
     return {"status": "alive"}
 
 async def save_base64_photo(base64_string: str) -> str:
-    """Сохраняет фото из base64 и возвращает file_id для Telegram"""
+    """Декодирует фото из base64 и возвращает file_id для Telegram"""
     try:
-        # Декодируем base64
         photo_data = base64.b64decode(base64_string)
-        
-        # Создаем временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            tmp_file.write(photo_data)
-            tmp_path = tmp_file.name
-        
-        # Отправляем фото в Telegram (как временный файл)
-        bot = Bot(token=Config.BOT_TOKEN)
-        
-        # Отправляем фото в специальный чат для получения file_id
-        # Можно отправить в любой чат, но лучше создать отдельный для хранения фото
-        chat_id = Config.ADMIN_GROUP_CHAT_ID  # Или специальный чат для медиа
-        
-        with open(tmp_path, 'rb') as f:
-            message = await bot.send_photo(
-                chat_id=chat_id,
-                photo=InputFile(f, filename='photo.jpg'),
-                caption="Временное фото для заявки"
-            )
-        
-        # Получаем file_id
-        file_id = message.photo[-1].file_id
-        
-        # Удаляем временный файл
-        os.unlink(tmp_path)
-        
-        return file_id
-        
+        return await upload_photo(photo_data)
     except Exception as e:
         logger.error(f"Ошибка сохранения фото: {e}")
         raise
 
-def send_to_group_sync(app_id: int, application: Application, photo_file_id: Optional[str] = None):
-    """Синхронная обертка для отправки в группу"""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(send_to_group(app_id, application, photo_file_id))
-        loop.close()
-    except Exception as e:
-        logger.error(f"Ошибка отправки в группу: {e}")
+async def hash_upload(upload: UploadFile) -> str:
+    """sha256 multipart-части, считается по кускам без чтения файла целиком"""
+    sha256 = hashlib.sha256()
+    while chunk := await upload.read(64 * 1024):
+        sha256.update(chunk)
+    await upload.seek(0)
+    return sha256.hexdigest()
 
-async def send_to_group(app_id: int, application: Application, photo_file_id: Optional[str] = None):
-    """Отправка заявки в групповой чат"""
-    bot = Bot(token=Config.BOT_TOKEN)
-    
-    # Формируем текст заявки
-    message_text = (
-        f"Новая заявка #{app_id} \nВнимание!\nЗаявка напрямую от клиента. Не забудьте сделать скидку 10%\n\n"
-        f"Адрес: {application.address}\n"
-        f"Задача: {application.task}\n"
-    )
-    
-    if application.comment and application.comment.strip():
-        message_text += f"Комментарий: {application.comment}\n"
+async def save_uploaded_photo(upload: UploadFile, digest: str) -> str:
+    """Загружает фото из multipart-части и возвращает file_id для Telegram"""
+    return await upload_photo(upload.file, digest, filename=upload.filename or 'photo.jpg')
+
+async def upload_photo(photo, digest: Optional[str] = None, filename: str = 'photo.jpg') -> str:
+    """Загружает фото в Telegram из памяти и возвращает file_id.
+
+    photo - bytes или файловый объект. Фото, уже загруженное раньше (повтор
+    запроса, дубликат с сайта), по sha256 берется из таблицы photo_files
+    без повторной загрузки. Для файлового объекта digest нужно передать.
+    """
+    if digest is None:
+        digest = hashlib.sha256(photo).hexdigest()
     
-    if photo_file_id:
-        message_text += f"📸 Фото приложено\n"
+    file_id = await db.get_photo_file_id(digest)
+    if file_id:
+        logger.info(f"Фото {digest[:12]} уже загружено, используем сохраненный file_id")
+        return file_id
     
-    message_text += f"От: {application.username}"
+    # Отправляем фото в чат для хранения (или в группу исполнителей)
+    # общим Bot диспетчера, чтобы получить file_id
+    bot = dispatcher.bot
+    chat_id = Config.PHOTO_STORAGE_CHAT_ID or Config.ADMIN_GROUP_CHAT_ID
     
-    keyboard = get_application_keyboard(app_id)
+    message = await bot.send_photo(
+        chat_id=chat_id,
+        photo=InputFile(photo, filename=filename),
+        caption="Временное фото для заявки",
+        # Запрос сайта ждет file_id, поэтому раньше массовых карточек в группу
+        rate_limit_args={'priority': PRIORITY_NORMAL}
+    )
+    file_id = message.photo[-1].file_id
     
-    # Отправляем с фото или без
-    if photo_file_id:
-        sent_message = await bot.send_photo(
-            chat_id=Config.ADMIN_GROUP_CHAT_ID,
-            photo=photo_file_id,
-            caption=message_text,
-            reply_markup=keyboard,
-            parse_mode='Markdown'
-        )
-    else:
-        sent_message = await bot.send_message(
-            chat_id=Config.ADMIN_GROUP_CHAT_ID,
-            text=message_text,
-            reply_markup=keyboard,
-            parse_mode='Markdown'
-        )
+    # file_id остается действительным и после удаления сообщения
+    if Config.PHOTO_DELETE_HELPER_MESSAGE:
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить временное сообщение с фото: {e}")
     
-    # Сохраняем message_id
-    db.set_message_id(app_id, sent_message.message_id)
-    logger.info(f"Заявка #{app_id} отправлена в группу")
+    await db.save_photo_file_id(digest, file_id)
+    return file_id
 
-def run_webhook_server():
-    """Запуск FastAPI сервера"""
-    uvicorn.run(app, host="0.0.0.0", port=7000)
+def run_webhook_server(workers: int = 1):
+    """Запуск FastAPI сервера отдельно от бота"""
+    if workers > 1:
+        # Каждый воркер - отдельный процесс со своим пулом и диспетчером
+        uvicorn.run("webhook:app", host=Config.API_HOST, port=Config.API_PORT, workers=workers)
+    else:
+        uvicorn.run(app, host=Config.API_HOST, port=Config.API_PORT)
 
 if __name__ == "__main__":
     run_webhook_server()
\ No newline at end of file